@@ -27,12 +27,12 @@ public class DashboardController {
     public ResponseEntity<Map<String, Object>> getSummary(
             @RequestParam(defaultValue = "24") int hours) {
 
-        // Use UTC to match MySQL Docker container timezone
-        LocalDateTime since = LocalDateTime.now(ZoneOffset.UTC).minusHours(hours);
+        // Rollup buckets are keyed by Unix time
+        long since = LocalDateTime.now(ZoneOffset.UTC).minusHours(hours).toEpochSecond(ZoneOffset.UTC);
 
         Map<String, Object> summary = new HashMap<>();
         summary.put("period_hours", hours);
-        summary.put("total_events", securityEventRepository.count());
+        summary.put("total_events", securityEventRepository.countAllFromRollup());
 
         // Events by type
         Map<String, Long> byType = new HashMap<>();
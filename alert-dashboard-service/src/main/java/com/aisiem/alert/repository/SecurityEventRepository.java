@@ -5,7 +5,6 @@ import org.springframework.data.jpa.repository.JpaRepository;
 import org.springframework.data.jpa.repository.Query;
 import org.springframework.stereotype.Repository;
 
-import java.time.LocalDateTime;
 import java.util.List;
 
 @Repository
@@ -20,9 +19,15 @@ public interface SecurityEventRepository extends JpaRepository<SecurityEvent, Lo
     @Query("SELECT e FROM SecurityEvent e WHERE e.status = 'NEW' ORDER BY e.createdAt DESC")
     List<SecurityEvent> findNewEvents();
 
-    @Query("SELECT e.eventType, COUNT(e) FROM SecurityEvent e WHERE e.createdAt >= :since GROUP BY e.eventType")
-    List<Object[]> countByEventTypeSince(LocalDateTime since);
+    // Counts come from the per-minute rollup maintained by the detection service (cost grows with minutes, not events)
+    @Query(value = "SELECT CAST(COALESCE(SUM(events), 0) AS SIGNED) FROM security_event_rollup", nativeQuery = true)
+    long countAllFromRollup();
 
-    @Query("SELECT e.severity, COUNT(e) FROM SecurityEvent e WHERE e.createdAt >= :since GROUP BY e.severity")
-    List<Object[]> countBySeveritySince(LocalDateTime since);
+    @Query(value = "SELECT event_type, CAST(SUM(events) AS SIGNED) FROM security_event_rollup "
+            + "WHERE bucket_start >= :sinceEpochSecond GROUP BY event_type", nativeQuery = true)
+    List<Object[]> countByEventTypeSince(long sinceEpochSecond);
+
+    @Query(value = "SELECT severity, CAST(SUM(events) AS SIGNED) FROM security_event_rollup "
+            + "WHERE bucket_start >= :sinceEpochSecond GROUP BY severity", nativeQuery = true)
+    List<Object[]> countBySeveritySince(long sinceEpochSecond);
 }
@@ -30,11 +30,33 @@ CREATE TABLE IF NOT EXISTS security_event (
     confidence DOUBLE DEFAULT 0.0 COMMENT 'AI confidence score 0.0 ~ 1.0',
     status VARCHAR(30) DEFAULT 'NEW' COMMENT 'NEW, INVESTIGATING, RESOLVED, FALSE_POSITIVE',
     raw_log TEXT,
+    dedup_key VARCHAR(255) NULL COMMENT 'event_type|blake2b(source_ip|rule)|opened_at_ms of an aggregated event',
+    event_count INT NOT NULL DEFAULT 1 COMMENT 'Detections folded into this event',
+    last_seen_at TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_security_event_dedup_key (dedup_key),
+    INDEX idx_security_event_created (created_at, id),
+    INDEX idx_security_event_status_created (status, created_at, id),
+    INDEX idx_security_event_type_created (event_type, created_at, id),
+    INDEX idx_security_event_severity_created (severity, created_at, id),
+    INDEX idx_security_event_source_ip_created (source_ip, created_at, id),
     FOREIGN KEY (rule_id) REFERENCES detection_rule(id) ON DELETE SET NULL
 );
 
+-- ========== Security Event Rollup ==========
+-- Per-minute counts maintained by the detection service (dashboards read this, not security_event)
+CREATE TABLE IF NOT EXISTS security_event_rollup (
+    bucket_start BIGINT NOT NULL COMMENT 'Unix time of the minute (UTC)',
+    event_type VARCHAR(50) NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    source_ip VARCHAR(45) NOT NULL DEFAULT '',
+    detected_by VARCHAR(20) NOT NULL,
+    events BIGINT NOT NULL DEFAULT 0 COMMENT 'security_event rows created',
+    detections BIGINT NOT NULL DEFAULT 0 COMMENT 'Including repeats folded into open events',
+    PRIMARY KEY (bucket_start, event_type, severity, source_ip, detected_by)
+);
+
 -- ========== Alerts ==========
 CREATE TABLE IF NOT EXISTS alert (
     id BIGINT AUTO_INCREMENT PRIMARY KEY,
@@ -65,7 +87,9 @@ INSERT INTO detection_rule (name, description, event_type, pattern, severity) VA
 ('Brute Force Login', '5+ failed logins from same IP within 5 minutes', 'BRUTE_FORCE', 'login_failed >= 5 AND time_window <= 300', 'HIGH'),
 ('SQL Injection Attempt', 'SQL injection patterns in request parameters', 'SQL_INJECTION', '(''\\s*(OR|AND)\\s+[''0-9]|UNION\\s+SELECT|DROP\\s+TABLE|;\\s*--)', 'CRITICAL'),
 ('Privilege Escalation', 'Non-admin user accessing admin endpoints', 'PRIVILEGE_ESCALATION', 'role != ADMIN AND path LIKE /admin/%', 'HIGH'),
-('Anomaly Detection', 'AI-detected abnormal behavior pattern', 'ANOMALY', 'ai_confidence >= 0.8', 'MEDIUM');
+('Anomaly Detection', 'AI-detected abnormal behavior pattern', 'ANOMALY', 'ai_confidence >= 0.8', 'MEDIUM'),
+('Password Spraying', 'Failed logins for 10+ distinct users from same IP within 5 minutes', 'BRUTE_FORCE', 'distinct(user_id WHERE login_failed) >= 10 AND time_window <= 300', 'HIGH'),
+('Path Scanning', '50+ distinct endpoints requested from same IP within 5 minutes', 'ANOMALY', 'distinct(endpoint) >= 50 AND time_window <= 300', 'MEDIUM');
 
 -- Default admin user (password: admin123 - BCrypt encoded)
 INSERT INTO user (username, password, email, role) VALUES
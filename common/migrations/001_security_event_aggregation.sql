@@ -0,0 +1,6 @@
+-- Detection suppression/aggregation columns (already part of init-db.sql for new databases)
+ALTER TABLE security_event
+    ADD COLUMN dedup_key VARCHAR(255) NULL COMMENT 'event_type|blake2b(source_ip|rule)|opened_at_ms of an aggregated event' AFTER raw_log,
+    ADD COLUMN event_count INT NOT NULL DEFAULT 1 COMMENT 'Detections folded into this event' AFTER dedup_key,
+    ADD COLUMN last_seen_at TIMESTAMP NULL AFTER event_count,
+    ADD UNIQUE KEY uk_security_event_dedup_key (dedup_key);
@@ -0,0 +1,9 @@
+-- Indexes for keyset-paginated event listing (already part of init-db.sql for new databases).
+-- Online DDL: the table stays readable and writable while the indexes are built.
+ALTER TABLE security_event
+    ADD INDEX idx_security_event_created (created_at, id),
+    ADD INDEX idx_security_event_status_created (status, created_at, id),
+    ADD INDEX idx_security_event_type_created (event_type, created_at, id),
+    ADD INDEX idx_security_event_severity_created (severity, created_at, id),
+    ADD INDEX idx_security_event_source_ip_created (source_ip, created_at, id),
+    ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,32 @@
+-- Per-minute security event rollup (already part of init-db.sql for new databases).
+CREATE TABLE IF NOT EXISTS security_event_rollup (
+    bucket_start BIGINT NOT NULL COMMENT 'Unix time of the minute (UTC)',
+    event_type VARCHAR(50) NOT NULL,
+    severity VARCHAR(20) NOT NULL,
+    source_ip VARCHAR(45) NOT NULL DEFAULT '',
+    detected_by VARCHAR(20) NOT NULL,
+    events BIGINT NOT NULL DEFAULT 0 COMMENT 'security_event rows created',
+    detections BIGINT NOT NULL DEFAULT 0 COMMENT 'Including repeats folded into open events',
+    PRIMARY KEY (bucket_start, event_type, severity, source_ip, detected_by)
+);
+
+-- Backfill from existing events, by creation minute. Run once, after deploying the
+-- detection service version that maintains the rollup. Only events created before the
+-- first minute it counted are backfilled, so none is counted twice.
+SET @rollup_start = (SELECT MIN(FROM_UNIXTIME(bucket_start)) FROM security_event_rollup);
+
+INSERT INTO security_event_rollup (bucket_start, event_type, severity, source_ip, detected_by, events, detections)
+SELECT
+    UNIX_TIMESTAMP(created_at) - MOD(UNIX_TIMESTAMP(created_at), 60),
+    event_type,
+    severity,
+    COALESCE(source_ip, ''),
+    detected_by,
+    COUNT(*),
+    SUM(event_count)
+FROM security_event
+WHERE @rollup_start IS NULL OR created_at < @rollup_start
+GROUP BY 1, 2, 3, 4, 5
+ON DUPLICATE KEY UPDATE
+    events = events + VALUES(events),
+    detections = detections + VALUES(detections);
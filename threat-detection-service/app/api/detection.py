@@ -1,56 +1,182 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.model.security_event import SecurityEvent, DetectionRule
-from app.schema.detection import SecurityEventResponse, DetectionRuleResponse, EventStatus
+from app.schema.detection import SecurityEventResponse, DetectionRuleResponse, EventStatus, Severity
+from app.service.event_query import InvalidCursor, page_etag, security_events_page
+from app.service.event_rollup import DIMENSIONS, event_rollup, rollup_stats
+from app.service.event_store import event_writer
+from app.service.rule_engine import get_rule_state_stats
+from app.service.shared_windows import shared_login_failures
+from app.service import detection_pool
+from app.service.anomaly_detector import anomaly_detector
+from app.service.ai_analyzer import verdict_cache
+from app.service.template_miner import template_sampler
+from app.service.ai_scheduler import ai_scheduler
 
 router = APIRouter(prefix="/api/detection", tags=["Threat Detection"])
 
 
 @router.get("/events", response_model=list[SecurityEventResponse])
-def list_security_events(
+async def list_security_events(
+    response: Response,
     status: Optional[EventStatus] = None,
     event_type: Optional[str] = None,
-    limit: int = Query(default=50, le=200),
-    db: Session = Depends(get_db),
+    severity: Optional[Severity] = None,
+    source_ip: Optional[str] = None,
+    since: Optional[datetime] = Query(default=None, description="created_at >= since"),
+    until: Optional[datetime] = Query(default=None, description="created_at < until"),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(default=50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_db),
 ):
-    """List security events with optional filters."""
-    query = db.query(SecurityEvent).order_by(SecurityEvent.created_at.desc())
+    """List security events, newest first, with optional filters.
 
-    if status:
-        query = query.filter(SecurityEvent.status == status.value)
-    if event_type:
-        query = query.filter(SecurityEvent.event_type == event_type)
+    Pages are keyset-paginated: pass the X-Next-Cursor header of a response
+    as cursor to get the next page (absent on the last page). Responses
+    carry an ETag; polling with If-None-Match gets 304 Not Modified without
+    a body while the page is unchanged.
+    """
+    try:
+        events, next_cursor = await security_events_page(
+            db,
+            limit,
+            cursor=cursor,
+            status=status.value if status else None,
+            event_type=event_type,
+            severity=severity.value if severity else None,
+            source_ip=source_ip,
+            since=since,
+            until=until,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return query.limit(limit).all()
+    headers = {"ETag": page_etag(events, next_cursor), "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return events
+
+
+@router.get("/stats")
+async def get_event_stats(
+    since: Optional[datetime] = Query(default=None, description="Default: 24 hours before until (UTC if no offset)"),
+    until: Optional[datetime] = Query(default=None, description="Default: now"),
+    interval: Literal["minute", "hour", "day", "total"] = "hour",
+    group_by: list[Literal["event_type", "severity", "source_ip", "detected_by"]] = Query(default=[]),
+    event_type: Optional[str] = None,
+    severity: Optional[Severity] = None,
+    source_ip: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Security event and detection counts per time bucket and group, from the per-minute rollup table.
+
+    Cost grows with the number of minute buckets in the range, not with the
+    number of events. Counts lag the event table by up to ROLLUP_FLUSH_SECONDS.
+    """
+    until = until or datetime.now(timezone.utc)
+    until = until if until.tzinfo else until.replace(tzinfo=timezone.utc)
+    since = since or until - timedelta(hours=24)
+    since = since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+
+    filters = {"event_type": event_type, "severity": severity.value if severity else None, "source_ip": source_ip}
+    group_by = [name for name in DIMENSIONS if name in group_by]
+    series = await rollup_stats(
+        db, since, until, interval, group_by, {name: value for name, value in filters.items() if value},
+    )
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "interval": interval,
+        "group_by": group_by,
+        "series": series,
+        "total": {
+            "events": sum(item["events"] for item in series),
+            "detections": sum(item["detections"] for item in series),
+        },
+    }
 
 
 @router.get("/events/{event_id}", response_model=SecurityEventResponse)
-def get_security_event(event_id: int, db: Session = Depends(get_db)):
+async def get_security_event(event_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific security event by ID."""
-    event = db.query(SecurityEvent).filter(SecurityEvent.id == event_id).first()
+    event = await db.get(SecurityEvent, event_id)
     if not event:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Security event not found")
     return event
 
 
 @router.patch("/events/{event_id}/status")
-def update_event_status(event_id: int, status: EventStatus, db: Session = Depends(get_db)):
+async def update_event_status(event_id: int, status: EventStatus, db: AsyncSession = Depends(get_db)):
     """Update the status of a security event."""
-    event = db.query(SecurityEvent).filter(SecurityEvent.id == event_id).first()
+    event = await db.get(SecurityEvent, event_id)
     if not event:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Security event not found")
 
     event.status = status.value
-    db.commit()
+    await db.commit()
     return {"message": f"Event {event_id} status updated to {status.value}"}
 
 
 @router.get("/rules", response_model=list[DetectionRuleResponse])
-def list_detection_rules(db: Session = Depends(get_db)):
+async def list_detection_rules(db: AsyncSession = Depends(get_db)):
     """List all detection rules."""
-    return db.query(DetectionRule).all()
+    return list((await db.execute(select(DetectionRule))).scalars())
+
+
+@router.get("/rules/state")
+async def get_rules_state():
+    """In-memory state of stateful rules: tracked keys, evictions and estimated bytes (plus shared window calls)."""
+    pool = detection_pool.detection_pool
+    if pool is not None:
+        state = {"workers": await pool.rule_state_stats(), "worker_restarts": pool.restarts}
+    else:
+        state = get_rule_state_stats()
+    if settings.RULE_STATE_BACKEND == "redis":
+        state["shared_windows"] = shared_login_failures.stats()
+    return {**state, "anomaly": anomaly_detector.stats()}
+
+
+@router.get("/stats/rollup")
+def get_rollup_stats():
+    """Rollup accumulator state: buckets waiting for the next flush, rows flushed, failed flushes."""
+    return event_rollup.stats()
+
+
+@router.get("/spool")
+def get_spool_stats():
+    """Local spool state: undrained segments and bytes, operations spooled and drained since start."""
+    spool = event_writer.spool
+    return spool.stats() if spool is not None else {"enabled": False}
+
+
+@router.get("/ai/cache")
+def get_ai_cache_stats():
+    """LLM verdict cache statistics: entries, hits, misses, hit ratio, evictions."""
+    return verdict_cache.stats()
+
+
+@router.get("/ai/templates")
+def get_ai_template_stats(top: int = Query(default=20, le=200)):
+    """Log templates mined ahead of the AI buffer, most frequent first."""
+    return template_sampler.stats(top)
+
+
+@router.get("/ai/scheduler")
+def get_ai_scheduler_stats():
+    """AI batching state: buffered logs/tokens, current token budget, drops and last LLM latency."""
+    return ai_scheduler.stats()
@@ -7,12 +7,65 @@ class Settings(BaseSettings):
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = True
 
+    # Metrics: time each rule on one in METRICS_RULE_SAMPLE_EVERY logs (0 = off)
+    METRICS_RULE_SAMPLE_EVERY: int = 100
+
+    # Admin: /admin/* requires X-Admin-Token to equal ADMIN_TOKEN (disabled when empty)
+    ADMIN_TOKEN: str = ""
+    PROFILE_MAX_SECONDS: int = 60
+
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_STREAM_KEY: str = "aisiem:logs"
     REDIS_CONSUMER_GROUP: str = "detection-group"
-    REDIS_CONSUMER_NAME: str = "detector-1"
+    # Empty = "detector-<hostname>-<pid>", unique per replica/process
+    REDIS_CONSUMER_NAME: str = ""
+    REDIS_READ_COUNT: int = 100
+    REDIS_READ_BLOCK_MS: int = 3000
+    REDIS_MAX_CONNECTIONS: int = 20
+    # Pending entries idle this long belong to a dead consumer and are taken over (XAUTOCLAIM)
+    REDIS_CLAIM_MIN_IDLE_MS: int = 60000
+    REDIS_CLAIM_INTERVAL_SECONDS: int = 30
+    # Validate every stream entry against the LogMessage schema (slower; entries are trusted strings otherwise)
+    LOG_STRICT_VALIDATION: bool = False
+    # Micro-batch mode: ack each XREADGROUP batch with one XACK after its detections are persisted
+    CONSUMER_MICRO_BATCH: bool = True
+
+    # Rule worker processes, sharded by source IP (micro-batch mode only); 0 = rules run on the event loop
+    DETECTION_WORKERS: int = 0
+
+    # Rule engine state (per-IP sliding windows); TTL 0 = same as the rule window
+    RULE_STATE_MAX_KEYS: int = 100_000
+    RULE_STATE_MAX_BYTES: int = 64 * 1024 * 1024
+    RULE_STATE_KEY_TTL_SECONDS: int = 0
+
+    # Brute force windows: "local" (per process) or "redis" (sorted sets shared by all replicas,
+    # updated by one Lua script call per micro-batch; local windows are the fallback if Redis fails)
+    RULE_STATE_BACKEND: str = "local"
+    SHARED_WINDOW_KEY_PREFIX: str = "aisiem:rules:"
+    SHARED_WINDOW_MAX_ENTRIES: int = 10_000
+
+    # Scan/spray rule state: exact items per IP until it is busy, then HyperLogLogs (2^precision bytes) per window pane
+    SKETCH_MAX_KEYS: int = 20_000
+    SKETCH_HLL_PRECISION: int = 7
+
+    # Stateful rule time: "processing" (wall clock on arrival) or "event" (LogMessage.timestamp,
+    # with logs more than EVENT_TIME_MAX_OUT_OF_ORDER_SECONDS behind the newest one dropped as late)
+    RULE_TIME_MODE: str = "processing"
+    EVENT_TIME_MAX_OUT_OF_ORDER_SECONDS: int = 30
+
+    # Rate anomalies: logs per source IP / endpoint / status code in ANOMALY_BUCKET_SECONDS buckets, flagged when
+    # a bucket reaches ANOMALY_MIN_COUNT and ANOMALY_Z_THRESHOLD standard deviations above its EWMA baseline.
+    # A key is only scored once tracked for ANOMALY_KEY_WARMUP_BUCKETS buckets (a new IP has no baseline yet)
+    ANOMALY_DETECTION_ENABLED: bool = True
+    ANOMALY_BUCKET_SECONDS: int = 10
+    ANOMALY_EWMA_ALPHA: float = 0.1
+    ANOMALY_Z_THRESHOLD: float = 4.0
+    ANOMALY_MIN_COUNT: int = 20
+    ANOMALY_WARMUP_BUCKETS: int = 6
+    ANOMALY_KEY_WARMUP_BUCKETS: int = 3
+    ANOMALY_MAX_KEYS: int = 50_000
 
     # MySQL
     DB_HOST: str = "localhost"
@@ -20,10 +73,52 @@ class Settings(BaseSettings):
     DB_NAME: str = "aisiem_db"
     DB_USER: str = "aisiem"
     DB_PASSWORD: str = "aisiem_pass"
+    # Any async SQLAlchemy URL instead of the MySQL settings, e.g. "sqlite+aiosqlite:///detections.db" for tests
+    DATABASE_URL_OVERRIDE: str = ""
+    # Async engine pool, shared by the event writer, the rollup flusher and the API
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 10
+    DB_POOL_RECYCLE_SECONDS: int = 1800
 
     @property
     def DATABASE_URL(self) -> str:
-        return f"mysql+mysqlconnector://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        if self.DATABASE_URL_OVERRIDE:
+            return self.DATABASE_URL_OVERRIDE
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    # Security event write-behind: flush every EVENT_WRITE_BATCH_SIZE events or EVENT_WRITE_FLUSH_SECONDS,
+    # consumers wait once EVENT_WRITE_MAX_PENDING events are queued
+    EVENT_WRITE_BATCH_SIZE: int = 200
+    EVENT_WRITE_FLUSH_SECONDS: float = 0.5
+    EVENT_WRITE_MAX_PENDING: int = 5000
+
+    # Detection suppression: repeats of (event_type, source_ip, rule) update the open event's count, last-seen
+    # time and confidence instead of inserting rows. A new event (and alert) is opened SUPPRESSION_REALERT_SECONDS
+    # after the open one, or once the group has been quiet for SUPPRESSION_IDLE_SECONDS
+    SUPPRESSION_ENABLED: bool = True
+    SUPPRESSION_REALERT_SECONDS: int = 3600
+    SUPPRESSION_IDLE_SECONDS: int = 900
+    SUPPRESSION_MAX_KEYS: int = 100_000
+
+    # Per-minute event/detection counts, accumulated in memory and added to security_event_rollup
+    # every ROLLUP_FLUSH_SECONDS (read by /api/detection/stats and the dashboards). While flushes fail, at most
+    # ROLLUP_MAX_PENDING_BUCKETS buckets are kept; counts for further buckets are dropped
+    ROLLUP_ENABLED: bool = True
+    ROLLUP_FLUSH_SECONDS: float = 10
+    ROLLUP_MAX_PENDING_BUCKETS: int = 100_000
+
+    # Local spool: security event batches whose write loses the connection or outlasts SPOOL_DB_TIMEOUT_SECONDS
+    # are fsynced to segment files under SPOOL_DIR and drained into the database in order once it recovers.
+    # A drain chunk rejected by the database SPOOL_MAX_DRAIN_ATTEMPTS times is moved to a dead-letter file there
+    SPOOL_ENABLED: bool = True
+    SPOOL_DIR: str = "spool"
+    SPOOL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024
+    SPOOL_DB_TIMEOUT_SECONDS: float = 5
+    SPOOL_DRAIN_BATCH_SIZE: int = 1000
+    SPOOL_RETRY_SECONDS: float = 1
+    SPOOL_MAX_DRAIN_ATTEMPTS: int = 3
 
     # Elasticsearch
     ELASTICSEARCH_HOST: str = "localhost"
@@ -35,6 +130,34 @@ class Settings(BaseSettings):
 
     # LLM Provider: "openai", "claude", "ollama", "none"
     LLM_PROVIDER: str = "none"
+    # Max LLM requests in flight at once (batches beyond this wait their turn)
+    LLM_MAX_CONCURRENCY: int = 4
+
+    # LLM verdict cache per normalized log line (IPs, numbers, IDs and timestamps masked)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 50_000
+    LLM_CACHE_TTL_SECONDS: int = 3600
+
+    # Log template mining ahead of the AI buffer: only new/changed templates, templates seen at most
+    # TEMPLATE_RARE_COUNT times and every TEMPLATE_SAMPLE_EVERY-th log of a common template reach the LLM
+    TEMPLATE_MINER_ENABLED: bool = True
+    TEMPLATE_TREE_DEPTH: int = 4
+    TEMPLATE_SIM_THRESHOLD: float = 0.4
+    TEMPLATE_MAX_CHILDREN: int = 100
+    TEMPLATE_MAX_CLUSTERS: int = 10_000
+    TEMPLATE_RARE_COUNT: int = 5
+    TEMPLATE_SAMPLE_EVERY: int = 100
+
+    # AI batching: a batch goes to the LLM once AI_BATCH_TOKEN_BUDGET prompt tokens are buffered or its oldest
+    # log has waited AI_BATCH_MAX_WAIT_SECONDS; the budget adapts within [MIN, MAX] to keep latency near the target
+    AI_BATCH_TOKEN_BUDGET: int = 2000
+    AI_BATCH_MIN_TOKENS: int = 500
+    AI_BATCH_MAX_TOKENS: int = 8000
+    AI_BATCH_MAX_WAIT_SECONDS: float = 10.0
+    AI_BATCH_TARGET_LATENCY_SECONDS: float = 10.0
+    # Hard cap on logs waiting for the LLM; when full: "drop_oldest", "drop_newest" or "sample" (reservoir)
+    AI_BUFFER_MAX_LOGS: int = 5000
+    AI_BUFFER_OVERFLOW_POLICY: str = "drop_oldest"
 
     # OpenAI API (GPT-4o mini etc.)
     OPENAI_API_KEY: str = ""
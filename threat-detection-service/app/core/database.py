@@ -1,15 +1,47 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
 
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, pool_size=5)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def create_engine(url: str) -> AsyncEngine:
+    """Async engine with the configured pool; SQLite (aiosqlite) gets a single shared in-memory connection."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            return create_async_engine(url, poolclass=StaticPool)
+        return create_async_engine(url)
 
-def get_db():
-    db = SessionLocal()
-    try:
+    return create_async_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+
+
+engine = create_engine(settings.DATABASE_URL)
+# One session per unit of work (a write batch, a flush, a request); never shared between tasks
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def create_sqlite_schema():
+    """Create the tables when running against SQLite; MySQL gets them from init-db.sql and the migrations."""
+    if engine.dialect.name != "sqlite":
+        return
+    from app.model.security_event import Base
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def dispose_engine():
+    await engine.dispose()
@@ -0,0 +1,94 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.config import settings
+
+# Per-log path: only counters incremented per batch, and rule timings sampled every
+# METRICS_RULE_SAMPLE_EVERY logs. Rule worker processes (DETECTION_WORKERS > 0) report
+# their timings only if PROMETHEUS_MULTIPROC_DIR is set.
+
+LOGS_CONSUMED = Counter("aisiem_logs_consumed_total", "Logs read from the Redis stream")
+
+RULE_SECONDS = Histogram(
+    "aisiem_rule_evaluation_seconds",
+    "Time to evaluate one rule against one log (sampled)",
+    ["rule"],
+    buckets=(1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2),
+)
+
+DETECTIONS = Counter("aisiem_detections_total", "Detections submitted for persisting", ["event_type", "detected_by"])
+
+DB_WRITE_SECONDS = Histogram("aisiem_db_write_seconds", "Time to write one batch of security events")
+DB_ROWS = Counter("aisiem_db_rows_total", "security_event rows written", ["operation"])
+DB_WRITE_ERRORS = Counter("aisiem_db_write_errors_total", "Failed security event batch writes")
+
+LLM_REQUEST_SECONDS = Histogram(
+    "aisiem_llm_request_seconds",
+    "LLM analysis request latency",
+    ["provider"],
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_TOKENS = Counter("aisiem_llm_tokens_total", "LLM tokens used", ["provider", "kind"])
+LLM_ERRORS = Counter("aisiem_llm_errors_total", "Failed LLM analyses", ["provider", "reason"])
+
+
+class _SampleEvery:
+    """Cheap 1-in-N sampler for the per-log path."""
+
+    def __init__(self, every: int):
+        self.every = every
+        self._n = 0
+
+    def __call__(self) -> bool:
+        if self.every <= 0:
+            return False
+        self._n += 1
+        if self._n >= self.every:
+            self._n = 0
+            return True
+        return False
+
+
+sample_rule_timing = _SampleEvery(settings.METRICS_RULE_SAMPLE_EVERY)
+
+# Values refreshed at scrape time (stream/group state from Redis, queue depths)
+_runtime_gauges: dict[str, tuple[str, dict[tuple, float], list[str]]] = {}
+
+
+def set_runtime_gauge(name: str, documentation: str, value: float, labels: dict[str, str] | None = None):
+    labels = labels or {}
+    _, values, _ = _runtime_gauges.setdefault(name, (documentation, {}, list(labels)))
+    values[tuple(labels.values())] = value
+
+
+def clear_runtime_gauge(name: str):
+    if name in _runtime_gauges:
+        _runtime_gauges[name][1].clear()
+
+
+class _RuntimeCollector:
+    def collect(self):
+        for name, (documentation, values, label_names) in _runtime_gauges.items():
+            family = GaugeMetricFamily(name, documentation, labels=label_names)
+            for label_values, value in values.items():
+                family.add_metric(list(label_values), value)
+            yield family
+
+
+_runtime_collector = _RuntimeCollector()
+REGISTRY.register(_runtime_collector)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Exposition of all metrics, aggregated over worker processes in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_runtime_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
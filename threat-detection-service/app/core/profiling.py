@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# One profile or trace at a time: both are process-wide and skew each other
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_cpu(seconds: float, interval: float) -> tuple[Counter, int]:
+    """Sample the stacks of all other threads every interval for seconds.
+
+    Returns (collapsed stacks -> sample count, number of sampling rounds).
+    Stacks are root-first and prefixed with the thread name, so the event
+    loop thread and the to_thread() workers show up separately. Threads
+    idle in the same place are sampled too; filter on the thread prefix or
+    look at the top functions to see where the loop spends its time.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        rounds = 0
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(labels))] += 1
+            rounds += 1
+            time.sleep(interval)
+
+        return stacks, rounds
+    finally:
+        _busy.release()
+
+
+def only_thread(stacks: Counter, name: str) -> Counter:
+    return Counter({stack: count for stack, count in stacks.items() if stack.split(";", 1)[0] == name})
+
+
+def top_functions(stacks: Counter, limit: int) -> list[dict]:
+    """Per-function sample counts: self (leaf frame) and total (anywhere on the stack)."""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for function in set(frames):
+            total[function] += count
+
+    samples = sum(stacks.values()) or 1
+    return [
+        {
+            "function": function,
+            "self_samples": own[function],
+            "total_samples": total[function],
+            "self_pct": round(100 * own[function] / samples, 2),
+            "total_pct": round(100 * total[function] / samples, 2),
+        }
+        for function, _ in own.most_common(limit)
+    ]
+
+
+def collapsed(stacks: Counter) -> str:
+    """Brendan Gregg's collapsed-stack format (flamegraph.pl, speedscope, inferno)."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def trace_allocations(seconds: float, frames: int, limit: int, group_by: str) -> dict:
+    """Trace allocations for seconds and return the sites holding the most memory still allocated.
+
+    If tracemalloc was already tracing (PYTHONTRACEMALLOC), the result is
+    the growth between the start and the end of the window instead.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+
+    try:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot() if was_tracing else None
+
+        time.sleep(seconds)
+
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+    finally:
+        _busy.release()
+
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ]
+    snapshot = snapshot.filter_traces(filters)
+
+    if before is not None:
+        stats = snapshot.compare_to(before.filter_traces(filters), group_by)
+        sites = [
+            {"site": s.traceback.format(), "size_diff": s.size_diff, "count_diff": s.count_diff, "size": s.size}
+            for s in stats[:limit]
+        ]
+    else:
+        stats = snapshot.statistics(group_by)
+        sites = [{"site": s.traceback.format(), "size": s.size, "count": s.count} for s in stats[:limit]]
+
+    return {
+        "mode": "diff" if before is not None else "window",
+        "seconds": seconds,
+        "traced_bytes": traced,
+        "peak_bytes": peak,
+        "sites": sites,
+    }
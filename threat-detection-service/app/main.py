@@ -1,13 +1,23 @@
 import asyncio
+import hmac
 import logging
 from contextlib import asynccontextmanager
+from typing import Literal
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
 
 from app.core.config import settings
-from app.core.database import SessionLocal
+from app.core.metrics import render_metrics, set_runtime_gauge
+from app.core import profiling
+from app.core.database import create_sqlite_schema, dispose_engine
 from app.api.detection import router as detection_router
-from app.service.stream_consumer import consume_logs, flush_ai_buffer
+from app.service.event_store import event_writer
+from app.service.event_rollup import event_rollup
+from app.service.detection_pool import start_detection_pool, stop_detection_pool
+from app.service.ai_scheduler import ai_scheduler
+from app.service.stream_consumer import consume_logs, stop_consumer, close_redis_pool, collect_stream_metrics
+from app.service.ai_analyzer import init_llm_clients, close_llm_clients
 
 logging.basicConfig(
     level=logging.DEBUG if settings.DEBUG else logging.INFO,
@@ -21,22 +31,25 @@ async def lifespan(app: FastAPI):
     """Start background consumer on app startup, cleanup on shutdown."""
     logger.info("Starting Threat Detection Service...")
 
-    db = SessionLocal()
-    consumer_task = asyncio.create_task(consume_logs(db))
-
-    # Periodic AI buffer flush
-    async def periodic_flush():
-        while True:
-            await asyncio.sleep(60)
-            await flush_ai_buffer(db)
-
-    flush_task = asyncio.create_task(periodic_flush())
+    await create_sqlite_schema()
+    init_llm_clients()
+    event_writer.start()
+    if settings.ROLLUP_ENABLED:
+        event_rollup.start()
+    ai_scheduler.start()
+    start_detection_pool()
+    consumer_task = asyncio.create_task(consume_logs())
 
     yield
 
-    consumer_task.cancel()
-    flush_task.cancel()
-    db.close()
+    await stop_consumer(consumer_task)
+    await ai_scheduler.stop()
+    await close_llm_clients()
+    stop_detection_pool()
+    await event_writer.stop()
+    await event_rollup.stop()
+    await dispose_engine()
+    await close_redis_pool()
     logger.info("Threat Detection Service stopped")
 
 
@@ -52,3 +65,73 @@ app.include_router(detection_router)
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": settings.APP_NAME}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus exposition: service metrics plus queue depths and consumer group state sampled now."""
+    scheduler = ai_scheduler.stats()
+    set_runtime_gauge("aisiem_ai_buffered_logs", "Logs waiting in the AI batch buffer", scheduler["buffered_logs"])
+    set_runtime_gauge("aisiem_ai_buffered_tokens", "Estimated tokens waiting in the AI batch buffer", scheduler["buffered_tokens"])
+    set_runtime_gauge("aisiem_ai_token_budget", "Current adaptive AI batch token budget", scheduler["token_budget"])
+    set_runtime_gauge("aisiem_ai_logs_dropped", "Logs dropped by the AI buffer overflow policy since start", scheduler["dropped"])
+    set_runtime_gauge("aisiem_event_writer_pending", "Security event operations queued for writing", event_writer.pending)
+    if event_writer.spool is not None:
+        spool = event_writer.spool.stats()
+        set_runtime_gauge("aisiem_spool_bytes", "Undrained bytes in the local security event spool", spool["bytes"])
+        set_runtime_gauge("aisiem_spool_segments", "Segment files in the local security event spool", spool["segments"])
+
+    try:
+        await asyncio.wait_for(collect_stream_metrics(), 2)
+    except Exception as e:
+        logger.debug(f"Stream metrics unavailable: {e}")
+
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin endpoints require a valid X-Admin-Token")
+
+
+@app.get("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(
+    seconds: float = Query(default=10, gt=0, le=settings.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(default=5, ge=1, le=1000),
+    format: Literal["top", "collapsed"] = "top",
+    limit: int = Query(default=30, ge=1, le=500),
+    thread: str | None = Query(default=None, description="Only this thread, e.g. MainThread (the event loop)"),
+):
+    """Sample all threads' stacks of the running service; top functions or collapsed stacks for a flamegraph."""
+    try:
+        stacks, rounds = await asyncio.to_thread(profiling.sample_cpu, seconds, interval_ms / 1000)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if thread is not None:
+        stacks = profiling.only_thread(stacks, thread)
+
+    if format == "collapsed":
+        return PlainTextResponse(profiling.collapsed(stacks))
+    return {
+        "seconds": seconds,
+        "interval_ms": interval_ms,
+        "rounds": rounds,
+        "samples": sum(stacks.values()),
+        "functions": profiling.top_functions(stacks, limit),
+    }
+
+
+@app.get("/admin/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory(
+    seconds: float = Query(default=10, gt=0, le=settings.PROFILE_MAX_SECONDS),
+    frames: int = Query(default=1, ge=1, le=50),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: int = Query(default=30, ge=1, le=500),
+):
+    """Trace allocations for a while and return the sites still holding the most memory."""
+    try:
+        return await asyncio.to_thread(profiling.trace_allocations, seconds, frames, limit, group_by)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
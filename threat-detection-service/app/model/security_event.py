@@ -1,36 +1,71 @@
-from sqlalchemy import Column, BigInteger, String, Double, Text, TIMESTAMP, ForeignKey, func
+from sqlalchemy import Column, BigInteger, Integer, String, Double, Text, TIMESTAMP, ForeignKey, Index, func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+# SQLite stand-ins for tests: only INTEGER PRIMARY KEY autoincrements, and timestamps are compared as
+# strings, so they are stored in CURRENT_TIMESTAMP's format (whole seconds, like MySQL TIMESTAMP)
+Id = BigInteger().with_variant(Integer, "sqlite")
+Timestamp = TIMESTAMP().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 
 class DetectionRule(Base):
     __tablename__ = "detection_rule"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(Id, primary_key=True, autoincrement=True)
     name = Column(String(255), nullable=False)
     description = Column(Text)
     event_type = Column(String(50), nullable=False)
     pattern = Column(Text, nullable=False)
     severity = Column(String(20), nullable=False)
     enabled = Column(String(5), default="1")
-    created_at = Column(TIMESTAMP, server_default=func.now())
-    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
 
 
 class SecurityEvent(Base):
     __tablename__ = "security_event"
+    # Keyset pagination (created_at DESC, id DESC), alone or after one equality filter
+    __table_args__ = (
+        Index("idx_security_event_created", "created_at", "id"),
+        Index("idx_security_event_status_created", "status", "created_at", "id"),
+        Index("idx_security_event_type_created", "event_type", "created_at", "id"),
+        Index("idx_security_event_severity_created", "severity", "created_at", "id"),
+        Index("idx_security_event_source_ip_created", "source_ip", "created_at", "id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(Id, primary_key=True, autoincrement=True)
     log_entry_id = Column(String(255))
     event_type = Column(String(50), nullable=False)
     severity = Column(String(20), nullable=False)
     description = Column(Text)
     source_ip = Column(String(45))
     detected_by = Column(String(20), nullable=False)  # RULE or AI
-    rule_id = Column(BigInteger, ForeignKey("detection_rule.id", ondelete="SET NULL"))
+    rule_id = Column(Id, ForeignKey("detection_rule.id", ondelete="SET NULL"))
     confidence = Column(Double, default=0.0)
     status = Column(String(30), default="NEW")
     raw_log = Column(Text)
-    created_at = Column(TIMESTAMP, server_default=func.now())
-    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Aggregation of repeated detections (see service/suppression.py)
+    dedup_key = Column(String(255), unique=True)
+    event_count = Column(Integer, nullable=False, server_default="1", default=1)
+    last_seen_at = Column(Timestamp)
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now())
+
+
+class SecurityEventRollup(Base):
+    """Security events and detections per minute, maintained by service/event_rollup.py."""
+
+    __tablename__ = "security_event_rollup"
+
+    bucket_start = Column(BigInteger, primary_key=True, autoincrement=False)  # Unix time of the minute (UTC)
+    event_type = Column(String(50), primary_key=True)
+    severity = Column(String(20), primary_key=True)
+    source_ip = Column(String(45), primary_key=True, default="")
+    detected_by = Column(String(20), primary_key=True)
+    events = Column(BigInteger, nullable=False, default=0)  # security_event rows created
+    detections = Column(BigInteger, nullable=False, default=0)  # including repeats folded into open events
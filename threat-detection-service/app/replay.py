@@ -0,0 +1,235 @@
+"""
+Offline Log Replay
+==================
+Runs archived logs through the rule engine without Redis, for backtesting
+rules over days or weeks of traffic.
+
+Input files are NDJSON (optionally gzip-compressed, *.gz), one log per line
+in the field layout RedisStreamProducer publishes (id, timestamp, source,
+logLevel, message, sourceIp, userId, endpoint, method, statusCode); "-"
+reads stdin. Logs are evaluated in event-time mode, so pass files in
+chronological order. With --workers, logs are sharded by source IP across
+worker processes exactly like the live consumer.
+
+Detections go to NDJSON (--output, "-" for stdout) and/or to the
+security_event table (--store, batched like the live writer). Stored
+events get --status RESOLVED by default so a backtest does not trigger
+alerts, and are dated by the logs' own timestamps. Repeats are folded into
+open events by the same suppressor as live traffic; their dedup_keys
+derive from log time, so storing the same archive again skips events
+already stored (the rollup still counts every run). --no-suppress
+stores one row per detection instead (raw rule hits, duplicated by every
+run).
+
+Usage (from threat-detection-service/):
+  python -m app.replay archive/2025-01-*.ndjson.gz --output detections.ndjson
+  python -m app.replay archive/*.ndjson.gz --workers 4 --store
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.schema.detection import EventStatus, LogRecord
+from app.service.event_time import EVENT_TIME, parse_timestamp
+from app.service.rule_engine import replay_logs
+from app.service.stream_consumer import parse_stream_entry
+
+logger = logging.getLogger("app.replay")
+
+
+def read_entries(paths: list[str], stats: Counter) -> Iterator[dict]:
+    """Yield stream entries from NDJSON / NDJSON.gz files, with all values as strings."""
+    for path in paths:
+        if path == "-":
+            lines = sys.stdin
+        elif path.endswith(".gz"):
+            lines = gzip.open(path, "rt", encoding="utf-8")
+        else:
+            lines = open(path, encoding="utf-8")
+
+        with lines:
+            for line_no, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    stats["invalid_lines"] += 1
+                    logger.warning(f"{path}:{line_no}: skipping invalid JSON ({e})")
+                    continue
+                stats["logs"] += 1
+                yield {key: "" if value is None else str(value) for key, value in entry.items()}
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class DetectionSink:
+    """Writes detections to NDJSON and/or the event store, counting them by type."""
+
+    def __init__(self, output: str | None, store: bool, store_batch_size: int, status: str, suppress: bool = True):
+        self.stats: Counter = Counter()
+        self.store_batch_size = store_batch_size
+        self.status = status
+        self.suppressor = None
+        if store and suppress:
+            from app.service.suppression import DetectionSuppressor
+
+            self.suppressor = DetectionSuppressor()
+
+        self._file = None
+        if output == "-":
+            self._file = sys.stdout
+        elif output:
+            self._file = open(output, "w", encoding="utf-8")
+
+        # (operation, row, log time) waiting for the next batch write
+        self._pending: list[tuple[tuple[str, dict], dict, float | None]] | None = [] if store else None
+        self._counted = False
+
+    async def write(self, detections: list[dict], log: LogRecord | None = None):
+        """Write a log's detections; stored events are dated (and suppressed) by the log's timestamp."""
+        now = created_at = None
+        if self._pending is not None:
+            from app.service.event_store import security_event_operation
+
+            now = parse_timestamp(log.timestamp) if log is not None else None
+            if now is not None:
+                created_at = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        for detection in detections:
+            self.stats[str(getattr(detection["event_type"], "value", detection["event_type"]))] += 1
+            if self._file is not None:
+                self._file.write(json.dumps(detection, ensure_ascii=False) + "\n")
+            if self._pending is not None:
+                operation, row = security_event_operation(detection, self.suppressor, self.status, now, created_at)
+                self._pending.append((operation, row, now))
+
+        if self._pending is not None and len(self._pending) >= self.store_batch_size:
+            await self._store()
+
+    async def close(self):
+        if self._pending:
+            await self._store()
+        if self._counted:
+            # Stored events count towards the dashboards like live ones
+            from app.service.event_rollup import event_rollup
+
+            await event_rollup.flush()
+        if self._pending is not None:
+            from app.core.database import dispose_engine
+
+            await dispose_engine()
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+
+    async def _store(self):
+        from app.core.database import SessionLocal
+        from app.service.event_rollup import event_rollup
+        from app.service.event_store import apply_security_event_operations
+        from app.service.suppression import INSERT
+
+        async with SessionLocal() as db_session:
+            # A rerun over the same logs produces the same dedup_keys: keep the rows already stored
+            operations = [operation for operation, _, _ in self._pending]
+            await apply_security_event_operations(operations, db_session, ignore_existing=self.suppressor is not None)
+        if settings.ROLLUP_ENABLED:
+            for operation, row, now in self._pending:
+                event_rollup.add(row, new_event=operation[0] == INSERT, now=now)
+            self._counted = True
+        self._pending = []
+
+
+async def replay_sequential(entries: Iterable[dict], sink: DetectionSink):
+    for log, detections in replay_logs(parse_stream_entry(entry) for entry in entries):
+        await sink.write(detections, log)
+
+
+async def _write_batch(sink: DetectionSink, logs: list[LogRecord], task: asyncio.Task):
+    for log, detections in zip(logs, (await task)[0]):
+        await sink.write(detections, log)
+
+
+async def replay_parallel(entries: Iterable[dict], sink: DetectionSink, workers: int, batch_size: int):
+    from app.service.detection_pool import ShardedRulePool
+
+    pool = ShardedRulePool(workers, time_mode=EVENT_TIME, rule_log_level=logging.ERROR)
+    try:
+        running = None
+        for batch in _batched((parse_stream_entry(entry) for entry in entries), batch_size):
+            task = asyncio.create_task(pool.run_batch(batch))
+            # Let the batch reach the workers, then read the next one while they evaluate it
+            await asyncio.sleep(0)
+            if running is not None:
+                await _write_batch(sink, *running)
+            running = batch, task
+        if running is not None:
+            await _write_batch(sink, *running)
+    finally:
+        pool.shutdown()
+
+
+async def replay(entries: Iterable[dict], sink: DetectionSink, workers: int, batch_size: int):
+    try:
+        if workers > 0:
+            await replay_parallel(entries, sink, workers, batch_size)
+        else:
+            await replay_sequential(entries, sink)
+    finally:
+        await sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived logs through the detection rules")
+    parser.add_argument("files", nargs="+", help="NDJSON or NDJSON.gz log files ('-' for stdin)")
+    parser.add_argument("--output", "-o", help="Write detections as NDJSON to this file ('-' for stdout)")
+    parser.add_argument("--store", action="store_true", help="Insert detections into the security_event table")
+    parser.add_argument("--status", default=EventStatus.RESOLVED.value, choices=[s.value for s in EventStatus],
+                        help="Status of stored events (default RESOLVED, so no alerts are sent)")
+    parser.add_argument("--no-suppress", action="store_true",
+                        help="Store one row per detection instead of folding repeats into open events")
+    parser.add_argument("--store-batch-size", type=int, default=settings.EVENT_WRITE_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=0, help="Rule worker processes (0 = evaluate in this process)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Logs per batch sent to the workers")
+    args = parser.parse_args()
+
+    if not args.output and not args.store:
+        parser.error("nothing to do: pass --output and/or --store")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s", stream=sys.stderr)
+    # Rule hits log a warning each; the summary below is what matters here
+    logging.getLogger("app.service.rule_engine").setLevel(logging.ERROR)
+
+    stats: Counter = Counter()
+    sink = DetectionSink(args.output, args.store, args.store_batch_size, args.status, not args.no_suppress)
+    entries = read_entries(args.files, stats)
+
+    started = time.perf_counter()
+    asyncio.run(replay(entries, sink, args.workers, args.batch_size))
+    elapsed = time.perf_counter() - started
+
+    logger.info(
+        f"Replayed {stats['logs']} logs in {elapsed:.1f}s ({stats['logs'] / max(elapsed, 1e-9):,.0f} logs/s), "
+        f"{sum(sink.stats.values())} detections {dict(sink.stats)}, {stats['invalid_lines']} invalid lines skipped"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
+import asyncio
 import logging
 import json
+import time
 import httpx
 import anthropic
 
 from app.core.config import settings
-from app.schema.detection import LogMessage, EventType, Severity
+from app.core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, LLM_ERRORS
+from app.schema.detection import LogRecord, EventType, Severity
+from app.service.verdict_cache import VerdictCache, verdict_key
 
 logger = logging.getLogger(__name__)
 
+# Long-lived, pooled provider clients (created by init_llm_clients() in lifespan)
+_http_client: httpx.AsyncClient | None = None
+_claude_client: anthropic.AsyncAnthropic | None = None
+
+# Caps in-flight LLM requests across all concurrently analyzed batches
+_llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+# Verdicts per normalized log line, so repeated lines are not sent to the LLM again
+verdict_cache = VerdictCache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL_SECONDS)
+
 ANALYSIS_PROMPT = """You are a cybersecurity analyst AI. Analyze the following log entries for potential security threats.
 
 For each threat detected, respond ONLY with a JSON array. Each item should have:
@@ -15,6 +29,7 @@ For each threat detected, respond ONLY with a JSON array. Each item should have:
 - "severity": one of "LOW", "MEDIUM", "HIGH", "CRITICAL"
 - "description": brief explanation of the threat
 - "confidence": float 0.0 to 1.0
+- "line": the number of the log entry the threat was found in
 
 If no threats are detected, respond with an empty array: []
 
@@ -23,11 +38,17 @@ Log entries to analyze:
 """
 
 
-def _format_logs(logs: list[LogMessage]) -> str:
-    return "\n".join(
-        f"[{log.timestamp}] {log.source} | {log.source_ip} | {log.method} {log.endpoint} | {log.message}"
-        for log in logs
-    )
+def _format_line(i: int, log: LogRecord) -> str:
+    return f"{i}. [{log.timestamp}] {log.source} | {log.source_ip} | {log.method} {log.endpoint} | {log.message}"
+
+
+def _format_logs(logs: list[LogRecord]) -> str:
+    return "\n".join(_format_line(i, log) for i, log in enumerate(logs, start=1))
+
+
+def estimate_tokens(log: LogRecord) -> int:
+    """Rough prompt tokens for one log line (~4 characters per token)."""
+    return len(_format_line(0, log)) // 4 + 1
 
 
 def _parse_llm_response(response_text: str) -> list[dict]:
@@ -47,66 +68,117 @@ def _parse_llm_response(response_text: str) -> list[dict]:
             "description": threat.get("description", "AI-detected anomaly"),
             "confidence": threat.get("confidence", 0.5),
             "detected_by": "AI",
+            "line": threat.get("line"),
         })
     return results
 
 
+def _record_usage(provider: str, prompt_tokens: int | None, completion_tokens: int | None):
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider, "completion").inc(completion_tokens)
+
+
+def init_llm_clients():
+    """Create the pooled client for the configured provider (called once at startup)."""
+    global _http_client, _claude_client
+
+    provider = settings.LLM_PROVIDER.lower()
+    if provider in ("openai", "ollama") and _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+            ),
+        )
+    elif provider == "claude" and _claude_client is None:
+        _claude_client = anthropic.AsyncAnthropic(api_key=settings.CLAUDE_API_KEY)
+
+
+async def close_llm_clients():
+    global _http_client, _claude_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _claude_client is not None:
+        await _claude_client.close()
+        _claude_client = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    if _http_client is None:
+        init_llm_clients()
+    return _http_client
+
+
+def _get_claude_client() -> anthropic.AsyncAnthropic:
+    if _claude_client is None:
+        init_llm_clients()
+    return _claude_client
+
+
 async def _analyze_with_openai(logs_text: str) -> list[dict]:
     """Call OpenAI API (GPT-4o mini etc.)."""
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
-            json={
-                "model": settings.OPENAI_MODEL,
-                "messages": [
-                    {"role": "user", "content": ANALYSIS_PROMPT.format(logs=logs_text)}
-                ],
-                "max_tokens": 1024,
-                "temperature": 0.1,
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        return _parse_llm_response(content)
+    response = await _get_http_client().post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"},
+        json={
+            "model": settings.OPENAI_MODEL,
+            "messages": [
+                {"role": "user", "content": ANALYSIS_PROMPT.format(logs=logs_text)}
+            ],
+            "max_tokens": 1024,
+            "temperature": 0.1,
+        },
+        timeout=60.0,
+    )
+    response.raise_for_status()
+    data = response.json()
+    usage = data.get("usage") or {}
+    _record_usage("openai", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    content = data["choices"][0]["message"]["content"]
+    return _parse_llm_response(content)
 
 
 async def _analyze_with_claude(logs_text: str) -> list[dict]:
     """Call Claude API."""
-    client = anthropic.Anthropic(api_key=settings.CLAUDE_API_KEY)
-    message = client.messages.create(
+    message = await _get_claude_client().messages.create(
         model=settings.CLAUDE_MODEL,
         max_tokens=1024,
         messages=[
             {"role": "user", "content": ANALYSIS_PROMPT.format(logs=logs_text)}
         ],
     )
+    _record_usage("claude", message.usage.input_tokens, message.usage.output_tokens)
     return _parse_llm_response(message.content[0].text)
 
 
 async def _analyze_with_ollama(logs_text: str) -> list[dict]:
     """Call local LLM via OpenAI-compatible API (llama-server / Ollama)."""
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        # Try OpenAI-compatible endpoint first (llama-server, vLLM, etc.)
-        response = await client.post(
-            f"{settings.OLLAMA_HOST}/v1/chat/completions",
-            json={
-                "model": settings.OLLAMA_MODEL,
-                "messages": [
-                    {"role": "user", "content": ANALYSIS_PROMPT.format(logs=logs_text)}
-                ],
-                "max_tokens": 1024,
-                "temperature": 0.1,
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
-        return _parse_llm_response(content)
+    # Try OpenAI-compatible endpoint first (llama-server, vLLM, etc.)
+    response = await _get_http_client().post(
+        f"{settings.OLLAMA_HOST}/v1/chat/completions",
+        json={
+            "model": settings.OLLAMA_MODEL,
+            "messages": [
+                {"role": "user", "content": ANALYSIS_PROMPT.format(logs=logs_text)}
+            ],
+            "max_tokens": 1024,
+            "temperature": 0.1,
+        },
+        timeout=120.0,
+    )
+    response.raise_for_status()
+    data = response.json()
+    usage = data.get("usage") or {}
+    _record_usage("ollama", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    content = data["choices"][0]["message"]["content"]
+    return _parse_llm_response(content)
 
 
-async def analyze_with_llm(logs: list[LogMessage]) -> list[dict]:
+async def analyze_with_llm(logs: list[LogRecord]) -> list[dict]:
     """Route to the configured LLM provider."""
     provider = settings.LLM_PROVIDER.lower()
 
@@ -121,25 +193,83 @@ async def analyze_with_llm(logs: list[LogMessage]) -> list[dict]:
         logger.warning("Claude selected but API key not set, skipping")
         return []
 
-    try:
-        logs_text = _format_logs(logs)
+    if provider == "openai":
+        analyze = _analyze_with_openai
+    elif provider == "claude":
+        analyze = _analyze_with_claude
+    elif provider == "ollama":
+        analyze = _analyze_with_ollama
+    else:
+        logger.error(f"Unknown LLM provider: {provider}")
+        return []
 
-        if provider == "openai":
-            results = await _analyze_with_openai(logs_text)
-        elif provider == "claude":
-            results = await _analyze_with_claude(logs_text)
-        elif provider == "ollama":
-            results = await _analyze_with_ollama(logs_text)
+    # Identical (normalized) lines share one verdict: reuse cached ones, send each new one once.
+    # The sharing only saves LLM requests; every log still gets its own detections below.
+    if settings.LLM_CACHE_ENABLED:
+        keys = [verdict_key(log) for log in logs]
+    else:
+        keys = [str(i) for i in range(len(logs))]
+
+    verdicts: dict[str, list[dict]] = {}
+    misses: dict[str, LogRecord] = {}
+    for key, log in zip(keys, logs):
+        if key in verdicts or key in misses:
+            continue
+        cached = verdict_cache.get(key) if settings.LLM_CACHE_ENABLED else None
+        if cached is not None:
+            verdicts[key] = cached
         else:
-            logger.error(f"Unknown LLM provider: {provider}")
-            return []
+            misses[key] = log
 
-        logger.info(f"LLM ({provider}) found {len(results)} threats in {len(logs)} logs")
-        return results
+    unattributed = []
+    if misses:
+        try:
+            logs_text = _format_logs(list(misses.values()))
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse LLM response: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"LLM analysis failed ({provider}): {e}")
-        return []
+            async with _llm_semaphore:
+                started = time.perf_counter()
+                results = await analyze(logs_text)
+                LLM_REQUEST_SECONDS.labels(provider).observe(time.perf_counter() - started)
+
+            logger.info(f"LLM ({provider}) found {len(results)} threats in {len(misses)} logs ({len(logs)} buffered)")
+
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse LLM response: {e}")
+            LLM_ERRORS.labels(provider, "parse").inc()
+            results = None
+        except Exception as e:
+            logger.error(f"LLM analysis failed ({provider}): {e}")
+            LLM_ERRORS.labels(provider, "request").inc()
+            results = None
+
+        if results is not None:
+            miss_keys = list(misses)
+            fresh = {key: [] for key in miss_keys}
+            for threat in results:
+                line = threat.pop("line", None)
+                try:
+                    line = int(line)
+                except (TypeError, ValueError):
+                    line = 0
+                # Lines are 1-based; 0 or a negative number must not index from the end
+                if 1 <= line <= len(miss_keys):
+                    fresh[miss_keys[line - 1]].append(threat)
+                else:
+                    unattributed.append(threat)
+            verdicts.update(fresh)
+
+            # Clean verdicts are only trustworthy if every threat could be tied to its line
+            if settings.LLM_CACHE_ENABLED and not unattributed:
+                for key, verdict in fresh.items():
+                    verdict_cache.put(key, verdict)
+
+    detections = []
+    for key, log in zip(keys, logs):
+        for threat in verdicts.get(key, ()):
+            detections.append({
+                **threat,
+                "log_entry_id": log.id,
+                "source_ip": log.source_ip,
+                "raw_log": log.message,
+            })
+    return detections + unattributed
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import random
+from collections import deque
+
+from app.core.config import settings
+from app.schema.detection import LogRecord
+from app.service.ai_analyzer import analyze_with_llm, estimate_tokens
+from app.service.event_store import event_writer
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+SAMPLE = "sample"
+
+
+class AIBatchScheduler:
+    """Single owner of the AI buffer: decides when and how much to send to the LLM.
+
+    Logs are buffered with an estimated prompt token count. A background task
+    sends a batch once token_budget tokens are buffered or the oldest log has
+    waited max_wait seconds, with at most max_in_flight batches outstanding.
+    After each batch the budget shrinks if the provider took longer than
+    target_latency and grows if a full batch came back well within it.
+
+    The buffer holds at most max_buffered logs. When the LLM falls behind,
+    overflow_policy decides what is lost: the oldest logs, the newest ones,
+    or (sample) a uniform reservoir sample of everything that arrived.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = settings.AI_BATCH_TOKEN_BUDGET,
+        min_tokens: int = settings.AI_BATCH_MIN_TOKENS,
+        max_tokens: int = settings.AI_BATCH_MAX_TOKENS,
+        max_wait: float = settings.AI_BATCH_MAX_WAIT_SECONDS,
+        target_latency: float = settings.AI_BATCH_TARGET_LATENCY_SECONDS,
+        max_buffered: int = settings.AI_BUFFER_MAX_LOGS,
+        overflow_policy: str = settings.AI_BUFFER_OVERFLOW_POLICY,
+        max_in_flight: int = settings.LLM_MAX_CONCURRENCY,
+    ):
+        if overflow_policy not in (DROP_OLDEST, DROP_NEWEST, SAMPLE):
+            raise ValueError(f"Unknown AI buffer overflow policy: {overflow_policy}")
+
+        self.token_budget = token_budget
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.target_latency = target_latency
+        self.max_buffered = max_buffered
+        self.overflow_policy = overflow_policy
+        self.max_in_flight = max_in_flight
+
+        # Items are [log, tokens, arrived_at]
+        self._buffer: deque[list] = deque()
+        self._buffered_tokens = 0
+        self._overflow_seen = 0
+        self._wakeup = asyncio.Event()
+        self._in_flight: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+        self._dropped = 0
+        self._batches = 0
+        self._last_latency: float | None = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Send everything still buffered, wait for outstanding batches, then stop."""
+        if self._task is None:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        while self._buffer or self._in_flight:
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight, return_exceptions=True)
+            else:
+                await asyncio.sleep(0)
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def submit(self, log: LogRecord):
+        """Buffer a log for AI analysis, applying the overflow policy when the buffer is full."""
+        tokens = estimate_tokens(log)
+        arrived_at = asyncio.get_running_loop().time()
+
+        if len(self._buffer) >= self.max_buffered:
+            self._dropped += 1
+            if self.overflow_policy == DROP_NEWEST:
+                return
+            if self.overflow_policy == DROP_OLDEST:
+                _, old_tokens, _ = self._buffer.popleft()
+                self._buffered_tokens -= old_tokens
+            else:
+                # Reservoir sampling over everything that arrived while the buffer was full
+                self._overflow_seen += 1
+                slot = random.randrange(self.max_buffered + self._overflow_seen)
+                if slot < self.max_buffered:
+                    entry = self._buffer[slot]
+                    self._buffered_tokens += tokens - entry[1]
+                    entry[0], entry[1] = log, tokens
+                return
+
+        self._buffer.append([log, tokens, arrived_at])
+        self._buffered_tokens += tokens
+        self._wakeup.set()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def stats(self) -> dict:
+        return {
+            "buffered_logs": len(self._buffer),
+            "buffered_tokens": self._buffered_tokens,
+            "max_buffered": self.max_buffered,
+            "overflow_policy": self.overflow_policy,
+            "dropped": self._dropped,
+            "token_budget": self.token_budget,
+            "in_flight": len(self._in_flight),
+            "batches": self._batches,
+            "last_latency_seconds": self._last_latency,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            timeout = None
+            if self._buffer and len(self._in_flight) < self.max_in_flight:
+                timeout = self._buffer[0][2] + self.max_wait - loop.time()
+                if self._stopping or self._buffered_tokens >= self.token_budget or timeout <= 0:
+                    self._dispatch(self._take_batch())
+                    continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _take_batch(self) -> list[LogRecord]:
+        logs = []
+        tokens = 0
+        while self._buffer and (not logs or tokens + self._buffer[0][1] <= self.token_budget):
+            log, log_tokens, _ = self._buffer.popleft()
+            logs.append(log)
+            tokens += log_tokens
+        self._buffered_tokens -= tokens
+
+        if len(self._buffer) < self.max_buffered:
+            self._overflow_seen = 0
+        return logs
+
+    def _dispatch(self, logs: list[LogRecord]):
+        task = asyncio.create_task(self._analyze_and_store(logs))
+        self._in_flight.add(task)
+        task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._wakeup.set()
+
+    async def _analyze_and_store(self, logs: list[LogRecord]):
+        loop = asyncio.get_running_loop()
+        batch_tokens = sum(estimate_tokens(log) for log in logs)
+        budget = self.token_budget
+
+        started = loop.time()
+        try:
+            ai_detections = await analyze_with_llm(logs)
+        except Exception as e:
+            logger.error(f"AI analysis of {len(logs)} logs failed: {e}")
+            return
+        finally:
+            self._batches += 1
+            self._adapt(loop.time() - started, batch_tokens >= budget * 0.9)
+
+        for detection in ai_detections:
+            await event_writer.submit(detection)
+            logger.info(f"AI detection: type={detection['event_type']}, confidence={detection['confidence']}")
+
+    def _adapt(self, latency: float, batch_was_full: bool):
+        self._last_latency = latency
+        if latency > self.target_latency:
+            self.token_budget = max(self.min_tokens, int(self.token_budget * 0.7))
+        elif batch_was_full and latency < self.target_latency / 2:
+            self.token_budget = min(self.max_tokens, int(self.token_budget * 1.25))
+
+
+ai_scheduler = AIBatchScheduler()
@@ -0,0 +1,247 @@
+import logging
+import time
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+
+import numpy as np
+
+from app.core.config import settings
+from app.schema.detection import LogRecord, EventType, Severity
+from app.service.verdict_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Bucket of rows holding no key: sorts after every real bucket, so eviction never picks them
+_FREE = np.iinfo(np.int64).max
+
+
+class RateBaseline:
+    """Per-key request counts per time bucket with an EWMA mean/variance baseline.
+
+    State lives in fixed-size NumPy arrays indexed by a row per key, so a
+    whole micro-batch is folded in and scored with a handful of vector
+    operations. Rows are updated lazily: when a key is seen in a new bucket,
+    its previous bucket is folded into the baseline and the empty buckets in
+    between decay it. When all rows are taken, the least recently active
+    ones are recycled. A key is scored only from warmup_buckets after it
+    started being tracked: before that its baseline is still zero, and any
+    first burst (one page load) would score its own count as z.
+    """
+
+    def __init__(self, max_keys: int, alpha: float, z_threshold: float, min_count: int, warmup_buckets: int = 0):
+        self.max_keys = max_keys
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_count = min_count
+        self.warmup_buckets = warmup_buckets
+
+        self._index: dict[str, int] = {}
+        self._keys: list[str | None] = [None] * max_keys
+        self._free = list(range(max_keys - 1, -1, -1))
+        self._current = np.zeros(max_keys)
+        self._mean = np.zeros(max_keys)
+        self._var = np.zeros(max_keys)
+        self._bucket = np.full(max_keys, _FREE, dtype=np.int64)
+        self._alerted = np.full(max_keys, -1, dtype=np.int64)
+        # Bucket each row's key started being tracked in
+        self._since = np.zeros(max_keys, dtype=np.int64)
+
+        self._evictions = 0
+        self._overflow = 0
+
+    def observe(self, keys: list[str], bucket: int, score: bool) -> list[tuple[str, int, float, float]]:
+        """Count keys into bucket; returns (key, count, baseline, z) for keys that just became anomalous."""
+        rows_of = self._reserve(dict.fromkeys(keys), bucket)
+        rows = np.fromiter((rows_of[key] for key in keys), dtype=np.int64, count=len(keys))
+        rows = rows[rows >= 0]
+        if not rows.size:
+            return []
+
+        touched, counts = np.unique(rows, return_counts=True)
+        self._roll(touched, bucket)
+        self._current[touched] += counts
+        if not score:
+            return []
+
+        current = self._current[touched]
+        mean = self._mean[touched]
+        # Poisson-like floor so keys with a perfectly steady baseline don't alert on +1
+        std = np.maximum(np.sqrt(np.maximum(self._var[touched], mean)), 1.0)
+        z = (current - mean) / std
+
+        hit = (
+            (z >= self.z_threshold)
+            & (current >= self.min_count)
+            & (self._alerted[touched] != bucket)
+            & (bucket - self._since[touched] >= self.warmup_buckets)
+        )
+        hit_rows = touched[hit]
+        self._alerted[hit_rows] = bucket
+        return [
+            (self._keys[row], int(count), float(baseline), float(z_score))
+            for row, count, baseline, z_score in zip(hit_rows, current[hit], mean[hit], z[hit])
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "tracked_keys": len(self._index),
+            "max_keys": self.max_keys,
+            "evictions": self._evictions,
+            "overflow": self._overflow,
+        }
+
+    def _reserve(self, keys: Iterable[str], bucket: int) -> dict[str, int]:
+        """Rows for all of a batch's distinct keys (-1 if untracked).
+
+        Rows of keys already tracked are looked up first and protected, so
+        recycling rows for the new keys cannot hand out one of them again.
+        """
+        rows: dict[str, int] = {}
+        missing = []
+        for key in keys:
+            row = self._index.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                rows[key] = row
+
+        if len(missing) > len(self._free):
+            self._evict(bucket, len(missing) - len(self._free), np.fromiter(rows.values(), dtype=np.int64))
+
+        for key in missing:
+            if not self._free:
+                # Every row is active in the current bucket; leave this key untracked
+                self._overflow += 1
+                rows[key] = -1
+                continue
+            row = self._free.pop()
+            self._index[key] = row
+            self._keys[row] = key
+            self._current[row] = self._mean[row] = self._var[row] = 0.0
+            self._bucket[row] = self._since[row] = bucket
+            self._alerted[row] = -1
+            rows[key] = row
+        return rows
+
+    def _evict(self, bucket: int, needed: int, reserved: np.ndarray):
+        # Recycle the least recently active rows (at least 1/16 of them), never ones in use in this bucket
+        # or reserved for the batch being counted
+        n = min(max(self.max_keys // 16, needed + reserved.size, 1), self.max_keys)
+        oldest = np.argpartition(self._bucket, n - 1)[:n]
+        oldest = oldest[(self._bucket[oldest] < bucket) & ~np.isin(oldest, reserved)]
+        for row in oldest.tolist():
+            del self._index[self._keys[row]]
+            self._keys[row] = None
+            self._bucket[row] = _FREE
+            self._free.append(row)
+        self._evictions += len(oldest)
+
+    def _roll(self, rows: np.ndarray, bucket: int):
+        stale = rows[self._bucket[rows] < bucket]
+        if not stale.size:
+            return
+
+        a = self.alpha
+        delta = self._current[stale] - self._mean[stale]
+        mean = self._mean[stale] + a * delta
+        var = (1 - a) * (self._var[stale] + a * delta * delta)
+
+        # Empty buckets since the key was last seen pull the baseline towards zero
+        decay = (1 - a) ** (bucket - self._bucket[stale] - 1)
+        self._mean[stale] = mean * decay
+        self._var[stale] = var * decay
+        self._current[stale] = 0.0
+        self._bucket[stale] = bucket
+
+
+# Endpoints repeat heavily, so masking is memoized rather than re-run per log
+_normalize_endpoint = lru_cache(maxsize=8192)(normalize_text)
+
+
+def _endpoint_key(log: LogRecord) -> str:
+    # IDs in paths would give every resource its own baseline
+    return _normalize_endpoint(log.endpoint) if log.endpoint else ""
+
+
+DIMENSIONS: list[tuple[str, str, Callable[[LogRecord], str]]] = [
+    ("source_ip", "source IP", lambda log: log.source_ip),
+    ("endpoint", "endpoint", _endpoint_key),
+    ("status_code", "status code", lambda log: log.status_code),
+]
+
+
+class RateAnomalyDetector:
+    """Statistical rate anomalies per source IP, endpoint and status code.
+
+    Logs are counted per key in bucket_seconds buckets of processing time.
+    A key is flagged (once per bucket) when its count in the current bucket
+    reaches min_count and a z-score of z_threshold against its EWMA baseline.
+    Nothing is flagged during the first warmup_buckets after startup, while
+    baselines are still being learned, nor for a key during the first
+    key_warmup_buckets after it was first seen (or evicted and seen again).
+    """
+
+    def __init__(
+        self,
+        bucket_seconds: int = settings.ANOMALY_BUCKET_SECONDS,
+        alpha: float = settings.ANOMALY_EWMA_ALPHA,
+        z_threshold: float = settings.ANOMALY_Z_THRESHOLD,
+        min_count: int = settings.ANOMALY_MIN_COUNT,
+        warmup_buckets: int = settings.ANOMALY_WARMUP_BUCKETS,
+        max_keys: int = settings.ANOMALY_MAX_KEYS,
+        key_warmup_buckets: int = settings.ANOMALY_KEY_WARMUP_BUCKETS,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.z_threshold = z_threshold
+        self.warmup_buckets = warmup_buckets
+
+        self._baselines = {
+            name: RateBaseline(max_keys, alpha, z_threshold, min_count, key_warmup_buckets) for name, _, _ in DIMENSIONS
+        }
+        self._first_bucket: int | None = None
+
+    def observe(self, logs: list[LogRecord], now: float | None = None) -> list[dict]:
+        """Count a micro-batch of logs and return ANOMALY detections for keys that spiked."""
+        if not logs:
+            return []
+        if now is None:
+            now = time.time()
+
+        bucket = int(now // self.bucket_seconds)
+        if self._first_bucket is None:
+            self._first_bucket = bucket
+        warm = bucket - self._first_bucket >= self.warmup_buckets
+
+        detections = []
+        for name, label, key_of in DIMENSIONS:
+            keyed = [(key, log) for log in logs if (key := key_of(log))]
+            hits = self._baselines[name].observe([key for key, _ in keyed], bucket, warm)
+            if not hits:
+                continue
+
+            # Attribute each anomaly to the latest log that contributed to it
+            last_log = dict(keyed)
+            for key, count, baseline, z in hits:
+                log = last_log[key]
+                logger.warning(f"Rate anomaly: {label}={key}, count={count}, baseline={baseline:.1f}, z={z:.1f}")
+                detections.append({
+                    "event_type": EventType.ANOMALY,
+                    "severity": Severity.HIGH if z >= 2 * self.z_threshold else Severity.MEDIUM,
+                    "description": (
+                        f"Rate anomaly on {label} '{key}': {count} logs in the current {self.bucket_seconds}s "
+                        f"window vs. a baseline of {baseline:.1f} (z={z:.1f})"
+                    ),
+                    "confidence": min(z / (2 * self.z_threshold), 1.0),
+                    "log_entry_id": log.id,
+                    "source_ip": log.source_ip,
+                    "detected_by": "RULE",
+                    "rule": f"rate_{name}:{key}",
+                    "raw_log": log.message,
+                })
+        return detections
+
+    def stats(self) -> dict:
+        return {name: baseline.stats() for name, baseline in self._baselines.items()}
+
+
+anomaly_detector = RateAnomalyDetector()
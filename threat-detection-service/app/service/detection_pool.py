@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import multiprocessing
+import operator
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.config import settings
+from app.schema.detection import LogRecord
+
+logger = logging.getLogger(__name__)
+
+# LogRecord -> tuple of its fields: plain tuples pickle in C, several times faster than slotted objects
+_log_fields = operator.attrgetter(*LogRecord.__slots__)
+
+
+def _init_worker(time_mode: str | None = None, rule_log_level: int | None = None):
+    logging.basicConfig(
+        level=logging.DEBUG if settings.DEBUG else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    if rule_log_level is not None:
+        logging.getLogger("app.service.rule_engine").setLevel(rule_log_level)
+    if time_mode is not None:
+        from app.service.rule_engine import reset_rule_state
+
+        # Only replays override the time mode; they keep brute force windows in the worker
+        reset_rule_state(time_mode, shared_brute_force=False)
+
+
+def _evaluate_logs(rows: list[tuple]) -> tuple[list[list[dict]], list[tuple]]:
+    """Worker side: run all rules over parsed logs (as field tuples), in order; also returns deferred login failures."""
+    from app.service.rule_engine import run_all_rules, take_login_failures
+
+    logs = [LogRecord(*row) for row in rows]
+    return [run_all_rules(log) for log in logs], take_login_failures(logs)
+
+
+def _rule_state_stats() -> dict:
+    from app.service.rule_engine import get_rule_state_stats
+
+    return get_rule_state_stats()
+
+
+class ShardedRulePool:
+    """Rule evaluation across worker processes, partitioned by source IP.
+
+    Each shard is a single-process executor, so every log from a given IP is
+    evaluated by the same process, in arrival order, and per-IP rule state
+    (brute force windows etc.) stays local to that worker. Logs are parsed
+    once, in the caller, and sent to the workers as tuples of their fields;
+    workers only send back detections.
+
+    A worker that dies (OOM kill, segfault) is replaced by a fresh process
+    and its batch retried once. The replacement starts with empty rule
+    state, so that shard's windows are lost.
+    """
+
+    def __init__(self, workers: int, time_mode: str | None = None, rule_log_level: int | None = None):
+        """time_mode overrides RULE_TIME_MODE in the workers, rule_log_level the rule engine's log level."""
+        self._context = multiprocessing.get_context("spawn")
+        self._initargs = (time_mode, rule_log_level)
+        self._shards = [self._new_shard() for _ in range(workers)]
+        self.restarts = 0
+
+    @property
+    def workers(self) -> int:
+        return len(self._shards)
+
+    def shard_of(self, source_ip: str) -> int:
+        # crc32 rather than hash(): str hashing is salted per process
+        return zlib.crc32(source_ip.encode()) % len(self._shards)
+
+    async def run_batch(self, logs: list[LogRecord]) -> tuple[list[list[dict]], list[tuple[int, str, float, int]]]:
+        """Evaluate a micro-batch of parsed logs.
+
+        Returns detections per log, in input order, and the login failures
+        deferred to the shared brute force windows (see take_login_failures),
+        with positions in logs.
+        """
+        batches: list[list[tuple]] = [[] for _ in self._shards]
+        positions: list[list[int]] = [[] for _ in self._shards]
+        for i, log in enumerate(logs):
+            shard = self.shard_of(log.source_ip or "")
+            batches[shard].append(_log_fields(log))
+            positions[shard].append(i)
+
+        shards = [shard for shard, batch in enumerate(batches) if batch]
+        results = await asyncio.gather(*(self._call(shard, _evaluate_logs, batches[shard]) for shard in shards))
+
+        detections: list[list[dict]] = [[] for _ in logs]
+        login_failures = []
+        for shard, (shard_results, shard_failures) in zip(shards, results):
+            for i, result in zip(positions[shard], shard_results):
+                detections[i] = result
+            login_failures.extend((positions[shard][i], *failure) for i, *failure in shard_failures)
+        return detections, login_failures
+
+    async def rule_state_stats(self) -> list[dict]:
+        return list(await asyncio.gather(*(self._call(shard, _rule_state_stats) for shard in range(len(self._shards)))))
+
+    def shutdown(self):
+        for shard in self._shards:
+            shard.shutdown(wait=True, cancel_futures=True)
+
+    def _new_shard(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=self._context, initializer=_init_worker, initargs=self._initargs,
+        )
+
+    async def _call(self, shard: int, fn, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._shards[shard]
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Concurrent calls on the same broken shard replace it only once
+            if self._shards[shard] is executor:
+                logger.error(f"Rule worker {shard} died, starting a new one (its per-IP rule state is lost)")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._shards[shard] = self._new_shard()
+                self.restarts += 1
+            return await loop.run_in_executor(self._shards[shard], fn, *args)
+
+
+detection_pool: ShardedRulePool | None = None
+
+
+def start_detection_pool():
+    """Start DETECTION_WORKERS rule worker processes (0 keeps rules on the event loop)."""
+    global detection_pool
+
+    if settings.DETECTION_WORKERS > 0 and detection_pool is None:
+        detection_pool = ShardedRulePool(settings.DETECTION_WORKERS)
+        logger.info(f"Started {settings.DETECTION_WORKERS} rule worker processes")
+
+
+def stop_detection_pool():
+    global detection_pool
+
+    if detection_pool is not None:
+        detection_pool.shutdown()
+        detection_pool = None
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.model.security_event import SecurityEventRollup
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60
+DIMENSIONS = ("event_type", "severity", "source_ip", "detected_by")
+INTERVALS = {"minute": 60, "hour": 3600, "day": 86400}
+
+_table = SecurityEventRollup.__table__
+
+
+async def _upsert(db_session: AsyncSession, rows: list[dict]):
+    """Add rows' counts to existing buckets (INSERT ... ON DUPLICATE KEY UPDATE, or ON CONFLICT on SQLite)."""
+    if db_session.bind.dialect.name == "sqlite":
+        stmt = sqlite.insert(_table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in _table.primary_key],
+            set_={"events": _table.c.events + stmt.excluded.events,
+                  "detections": _table.c.detections + stmt.excluded.detections},
+        )
+    else:
+        stmt = mysql.insert(_table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            events=_table.c.events + stmt.inserted.events,
+            detections=_table.c.detections + stmt.inserted.detections,
+        )
+    await db_session.execute(stmt)
+
+
+class EventRollup:
+    """Per-minute counts of security events, added to security_event_rollup in the background.
+
+    Counts are keyed by (minute, event_type, severity, source_ip,
+    detected_by). A new security_event row counts as one event and one
+    detection; a repeat folded into an open event counts as a detection
+    only. Every flush_interval seconds the accumulated counts are added to
+    the table with one upsert, so replicas can flush into the same buckets
+    and the table lags by at most flush_interval. Failed flushes keep their
+    counts for the next one, up to max_pending buckets: beyond that, counts
+    for buckets not already pending are dropped (and counted in stats).
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = settings.ROLLUP_FLUSH_SECONDS,
+        session_factory=SessionLocal,
+        max_pending: int = settings.ROLLUP_MAX_PENDING_BUCKETS,
+    ):
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+
+        # (bucket_start, *DIMENSIONS) -> [events, detections]
+        self._pending: dict[tuple, list[int]] = {}
+        self._task: asyncio.Task | None = None
+        self._flushed_rows = 0
+        self._failed_flushes = 0
+        self._dropped_buckets = 0
+
+    def add(self, row: dict, new_event: bool, now: float | None = None):
+        """Count a persisted detection (a security_event row, as built by event_store)."""
+        if now is None:
+            now = time.time()
+        bucket = int(now) - int(now) % BUCKET_SECONDS
+        key = (
+            bucket,
+            getattr(row["event_type"], "value", row["event_type"]),
+            getattr(row["severity"], "value", row["severity"]),
+            row.get("source_ip") or "",
+            getattr(row["detected_by"], "value", row["detected_by"]),
+        )
+        counts = self._pending.get(key)
+        if counts is None:
+            if len(self._pending) >= self.max_pending:
+                self._dropped_buckets += 1
+                return
+            counts = self._pending[key] = [0, 0]
+        if new_event:
+            counts[0] += 1
+        counts[1] += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await self._write(pending)
+        except asyncio.CancelledError:
+            # Stopped mid-write: the transaction is rolled back, stop() writes these again
+            self._merge(pending)
+            raise
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} rollup buckets, keeping them for the next flush: {e}")
+            self._failed_flushes += 1
+            self._merge(pending)
+
+    def stats(self) -> dict:
+        return {
+            "pending_buckets": len(self._pending),
+            "flushed_rows": self._flushed_rows,
+            "failed_flushes": self._failed_flushes,
+            "dropped_buckets": self._dropped_buckets,
+            "max_pending_buckets": self.max_pending,
+            "flush_interval_seconds": self.flush_interval,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _merge(self, pending: dict[tuple, list[int]]):
+        dropped = 0
+        for key, (events, detections) in pending.items():
+            counts = self._pending.get(key)
+            if counts is None:
+                if len(self._pending) >= self.max_pending:
+                    dropped += 1
+                    continue
+                counts = self._pending[key] = [0, 0]
+            counts[0] += events
+            counts[1] += detections
+        if dropped:
+            logger.warning(f"Rollup pending buckets full ({self.max_pending}), dropped {dropped} buckets")
+            self._dropped_buckets += dropped
+
+    async def _write(self, pending: dict[tuple, list[int]]):
+        # Sorted by primary key so concurrent upserts from replicas lock rows in the same order
+        rows = [
+            {"bucket_start": key[0], **dict(zip(DIMENSIONS, key[1:])), "events": events, "detections": detections}
+            for key, (events, detections) in sorted(pending.items())
+        ]
+        async with self.session_factory() as db_session:
+            await _upsert(db_session, rows)
+            await db_session.commit()
+        self._flushed_rows += len(rows)
+
+
+async def rollup_stats(
+    db_session: AsyncSession,
+    since: datetime,
+    until: datetime,
+    interval: str,
+    group_by: list[str],
+    filters: dict[str, str] | None = None,
+) -> list[dict]:
+    """Events and detections in [since, until) per interval ("minute", "hour", "day" or "total") and group_by columns.
+
+    Reads only rollup rows of the range (a primary key range scan), never security_event.
+    """
+    columns = [_table.c[name] for name in group_by]
+    selected = list(columns)
+    if interval != "total":
+        step = INTERVALS[interval]
+        bucket = (_table.c.bucket_start - _table.c.bucket_start % step).label("bucket")
+        selected.insert(0, bucket)
+
+    query = (
+        select(*selected, func.sum(_table.c.events).label("events"), func.sum(_table.c.detections).label("detections"))
+        .where(_table.c.bucket_start >= int(since.timestamp()), _table.c.bucket_start < int(until.timestamp()))
+    )
+    for name, value in (filters or {}).items():
+        query = query.where(_table.c[name] == value)
+    if selected:
+        query = query.group_by(*selected).order_by(*selected)
+
+    results = []
+    for row in (await db_session.execute(query)).mappings():
+        item = {name: row[name] for name in group_by}
+        if interval != "total":
+            item = {"bucket": datetime.fromtimestamp(row["bucket"], tz=timezone.utc).isoformat(), **item}
+        item["events"] = int(row["events"] or 0)
+        item["detections"] = int(row["detections"] or 0)
+        results.append(item)
+    return results
+
+
+event_rollup = EventRollup()
@@ -1,29 +1,389 @@
+import asyncio
 import logging
-from sqlalchemy.orm import Session
+import time
+from datetime import datetime, timezone
+from itertools import groupby
 
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import DETECTIONS, DB_WRITE_SECONDS, DB_ROWS, DB_WRITE_ERRORS
 from app.model.security_event import SecurityEvent
+from app.service.suppression import DetectionSuppressor, INSERT
+from app.service.event_rollup import EventRollup, event_rollup
+from app.service.spool import DetectionSpool
 
 logger = logging.getLogger(__name__)
 
 
-async def save_security_event(detection: dict, db_session: Session):
+def _to_row(detection: dict) -> dict:
+    return {
+        "log_entry_id": detection.get("log_entry_id"),
+        "event_type": detection["event_type"],
+        "severity": detection["severity"],
+        "description": detection.get("description"),
+        "source_ip": detection.get("source_ip"),
+        "detected_by": detection["detected_by"],
+        "rule_id": detection.get("rule_id"),
+        "confidence": detection.get("confidence", 0.0),
+        "status": "NEW",
+        "raw_log": detection.get("raw_log"),
+    }
+
+
+async def save_security_event(detection: dict, db_session: AsyncSession):
     """Save a detected security event to MySQL."""
-    event = SecurityEvent(
-        log_entry_id=detection.get("log_entry_id"),
-        event_type=detection["event_type"],
-        severity=detection["severity"],
-        description=detection.get("description"),
-        source_ip=detection.get("source_ip"),
-        detected_by=detection["detected_by"],
-        rule_id=detection.get("rule_id"),
-        confidence=detection.get("confidence", 0.0),
-        status="NEW",
-        raw_log=detection.get("raw_log"),
-    )
+    event = SecurityEvent(**_to_row(detection))
 
     db_session.add(event)
-    db_session.commit()
-    db_session.refresh(event)
+    await db_session.commit()
+    await db_session.refresh(event)
 
     logger.info(f"Saved security event: id={event.id}, type={event.event_type}")
     return event
+
+
+async def save_security_events(detections: list[dict], db_session: AsyncSession, status: str = "NEW") -> int:
+    """Save detections with a single multi-row INSERT, in the given order."""
+    if not detections:
+        return 0
+
+    await db_session.execute(insert(SecurityEvent).values([{**_to_row(d), "status": status} for d in detections]))
+    await db_session.commit()
+    return len(detections)
+
+
+def _rule_of(detection: dict) -> str:
+    return detection.get("rule") or detection["detected_by"]
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Whether a failed write may succeed if retried later (lost connection, timeout), unlike rejected data."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def security_event_operation(
+    detection: dict,
+    suppressor: DetectionSuppressor | None = None,
+    status: str = "NEW",
+    now: float | None = None,
+    created_at: datetime | None = None,
+) -> tuple[tuple[str, dict], dict]:
+    """A detection's security_event row and the operation persisting it (folded into an open event by suppressor).
+
+    created_at (naive UTC) replaces the column default on an inserted row.
+    """
+    row = {**_to_row(detection), "status": status}
+    if created_at is not None:
+        row["created_at"] = created_at
+    if suppressor is None:
+        return (INSERT, row), row
+    return suppressor.apply(row, _rule_of(detection), now), row
+
+
+def coalesce_operations(operations: list[tuple[str, dict]]) -> tuple[list[dict], list[dict]]:
+    """Reduce suppressor operations to the rows to insert and the final update per dedup_key.
+
+    Updates to an event inserted in the same batch are folded into its row.
+    """
+    inserts: list[dict] = []
+    inserted: dict[str, dict] = {}
+    updates: dict[str, dict] = {}
+
+    for kind, row in operations:
+        if kind == INSERT:
+            inserts.append(row)
+            if row.get("dedup_key"):
+                inserted[row["dedup_key"]] = row
+        elif row["dedup_key"] in inserted:
+            inserted[row["dedup_key"]].update(row)
+        else:
+            updates[row["dedup_key"]] = row
+
+    return inserts, list(updates.values())
+
+
+_UPDATE_OPEN_EVENT = (
+    update(SecurityEvent.__table__)
+    .where(SecurityEvent.__table__.c.dedup_key == bindparam("b_dedup_key"))
+    .values(
+        event_count=bindparam("b_event_count"),
+        last_seen_at=bindparam("b_last_seen_at"),
+        confidence=bindparam("b_confidence"),
+        description=bindparam("b_description"),
+    )
+)
+
+
+async def apply_security_event_operations(
+    operations: list[tuple[str, dict]], db_session: AsyncSession, ignore_existing: bool = False,
+) -> tuple[int, int]:
+    """Write a batch of insert/update operations in one transaction: one multi-row INSERT, one executemany UPDATE.
+
+    With ignore_existing, inserts whose dedup_key is already stored are skipped
+    (replaying operations that may have been committed before).
+    """
+    inserts, updates = coalesce_operations(operations)
+
+    # A multi-row INSERT needs the same columns in every row: spooled rows carry created_at, others leave it to the DB
+    for _, rows in groupby(inserts, key=dict.keys):
+        stmt = insert(SecurityEvent).values(list(rows))
+        if ignore_existing:
+            stmt = stmt.prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+        await db_session.execute(stmt)
+    if updates:
+        await db_session.execute(_UPDATE_OPEN_EVENT, [{f"b_{k}": v for k, v in row.items()} for row in updates])
+    await db_session.commit()
+    return len(inserts), len(updates)
+
+
+class EventWriter:
+    """Write-behind batcher for security events.
+
+    Detections from the rule and AI paths are queued and written by a single
+    background task, one multi-row INSERT per batch, in submission order. A
+    batch is flushed when batch_size detections are queued or flush_interval
+    seconds after its first one arrived. The queue is bounded by max_pending,
+    so submit() waits (backpressure) while the database is behind.
+
+    With a suppressor, repeats of an open event become updates of its row
+    instead of new rows, and all updates of one event within a batch are
+    coalesced into a single UPDATE. With a rollup, every committed
+    detection is counted into its per-minute buckets.
+
+    With a spool, a batch whose write fails transiently (connection errors,
+    or taking longer than db_timeout) is appended to the on-disk spool
+    instead, and so is every batch after it until a background drainer has
+    replayed the spool into the database in order. Spooled detections count
+    as persisted, so the consumer keeps acknowledging at line rate while
+    MySQL is down or slow; a batch the database rejects fails its futures
+    as without a spool. Drained inserts skip dedup_keys already stored,
+    since a timed-out write may still have committed; updates set absolute
+    values and replay as they are. The drainer retries transient failures
+    indefinitely, and moves a chunk the database rejects max_drain_attempts
+    times to the spool's dead-letter file.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.EVENT_WRITE_BATCH_SIZE,
+        flush_interval: float = settings.EVENT_WRITE_FLUSH_SECONDS,
+        max_pending: int = settings.EVENT_WRITE_MAX_PENDING,
+        session_factory=SessionLocal,
+        suppressor: DetectionSuppressor | None = None,
+        rollup: EventRollup | None = None,
+        spool: DetectionSpool | None = None,
+        db_timeout: float = settings.SPOOL_DB_TIMEOUT_SECONDS,
+        drain_batch_size: int = settings.SPOOL_DRAIN_BATCH_SIZE,
+        retry_seconds: float = settings.SPOOL_RETRY_SECONDS,
+        max_drain_attempts: int = settings.SPOOL_MAX_DRAIN_ATTEMPTS,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.suppressor = suppressor
+        self.rollup = rollup
+        self.spool = spool
+        self.db_timeout = db_timeout
+        self.drain_batch_size = drain_batch_size
+        self.retry_seconds = retry_seconds
+        self.max_drain_attempts = max_drain_attempts
+
+        # Items are ((kind, row), future, detection row); a None operation is a flush marker
+        self._queue: asyncio.Queue[tuple[tuple[str, dict] | None, asyncio.Future, dict | None]] = asyncio.Queue(
+            maxsize=max_pending,
+        )
+        self._task: asyncio.Task | None = None
+        self._drain_task: asyncio.Task | None = None
+        self._spooled = asyncio.Event()
+        # Rejections of the spool's oldest undrained chunk so far
+        self._drain_rejections = 0
+
+    def start(self):
+        if self._task is None:
+            if self.spool is not None:
+                self.spool.open()
+                self._drain_task = asyncio.create_task(self._drain())
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything still queued (to the database or the spool), then stop the background tasks."""
+        if self._task is None:
+            return
+        await self.flush()
+        for task in (self._task, self._drain_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._drain_task = None
+        if self.spool is not None:
+            self.spool.close()
+
+    async def submit(self, detection: dict) -> asyncio.Future:
+        """Queue a detection; the returned future resolves once its row is committed."""
+        operation, row = security_event_operation(detection, self.suppressor)
+        DETECTIONS.labels(getattr(row["event_type"], "value", row["event_type"]), row["detected_by"]).inc()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future, row))
+        return future
+
+    async def flush(self):
+        """Write everything submitted so far without waiting for the flush interval."""
+        marker = asyncio.get_running_loop().create_future()
+        await self._queue.put((None, marker, None))
+        await marker
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size and batch[-1][0] is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._write(batch)
+
+    async def _write(self, batch: list[tuple[tuple[str, dict] | None, asyncio.Future, dict | None]]):
+        operations = [operation for operation, _, _ in batch if operation is not None]
+
+        try:
+            if operations:
+                saved = await self._persist(operations)
+        except Exception as e:
+            logger.error(f"Failed to save {len(operations)} security events: {e}")
+            DB_WRITE_ERRORS.inc()
+            self._forget_inserts(operations)
+            for operation, future, _ in batch:
+                if operation is not None and not future.done():
+                    future.set_exception(e)
+                    # Nobody may be awaiting it; don't warn about an unretrieved exception
+                    future.exception()
+        else:
+            for operation, future, row in batch:
+                if operation is None:
+                    continue
+                if not future.done():
+                    future.set_result(None)
+                if self.rollup is not None:
+                    self.rollup.add(row, new_event=operation[0] == INSERT)
+            if operations:
+                logger.info(saved)
+
+        for operation, future, _ in batch:
+            if operation is None and not future.done():
+                future.set_result(None)
+
+    async def _persist(self, operations: list[tuple[str, dict]]) -> str:
+        """Write operations to the database, or to the spool while it is in use or the database fails."""
+        if self.spool is None:
+            inserted, updated = await self._write_batch(operations)
+            return f"Saved {inserted} security events, updated {updated} open events"
+
+        # Anything spooled goes to the database first; keep the order
+        if self.spool.empty:
+            try:
+                inserted, updated = await asyncio.wait_for(self._write_batch(operations), self.db_timeout)
+                return f"Saved {inserted} security events, updated {updated} open events"
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                logger.warning(f"Database write failed ({e!r}), spooling security events until it recovers")
+                DB_WRITE_ERRORS.inc()
+
+        # Spooled events keep the time they were detected rather than the time they are drained
+        created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        operations = [(kind, {**row, "created_at": created_at}) if kind == INSERT else (kind, row)
+                      for kind, row in operations]
+        await asyncio.to_thread(self.spool.append, operations)
+        self._spooled.set()
+        return f"Spooled {len(operations)} security event operations"
+
+    async def _drain(self):
+        """Replay the spool into the database, oldest first, backing off while the database is down."""
+        delay = self.retry_seconds
+        while True:
+            if self.spool.empty:
+                self._spooled.clear()
+                await self._spooled.wait()
+            try:
+                await self._drain_segment()
+                delay = self.retry_seconds
+            except Exception as e:
+                logger.warning(f"Spool drain failed ({e!r}), retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    async def _drain_segment(self):
+        seq = self.spool.oldest()
+        if seq is None:
+            # Caught up with the sealed segments; take over the one being appended to
+            await asyncio.to_thread(self.spool.seal_active)
+            seq = self.spool.oldest()
+            if seq is None:
+                return
+
+        offset, records = await asyncio.to_thread(self.spool.read, seq)
+        for i in range(0, len(records), self.drain_batch_size):
+            chunk = records[i:i + self.drain_batch_size]
+            operations = [operation for _, operation in chunk]
+            try:
+                await self._write_batch(operations, ignore_existing=True)
+            except Exception as e:
+                if _is_transient(e):
+                    raise
+                self._drain_rejections += 1
+                if self._drain_rejections < self.max_drain_attempts:
+                    raise
+                logger.error(
+                    f"Database rejected {len(chunk)} spooled operations of segment {seq} "
+                    f"{self._drain_rejections} times ({e!r}), moving them to the dead-letter file"
+                )
+                await asyncio.to_thread(self.spool.dead_letter, seq, operations)
+                self._forget_inserts(operations)
+            self._drain_rejections = 0
+            await asyncio.to_thread(self.spool.commit, seq, offset, chunk[-1][0], len(chunk))
+            offset = chunk[-1][0]
+        await asyncio.to_thread(self.spool.remove, seq)
+        logger.info(f"Drained spool segment {seq} ({len(records)} operations)")
+
+    def _forget_inserts(self, operations: list[tuple[str, dict]]):
+        # Repeats of events whose row was not stored must open them again, not update nothing
+        if self.suppressor is not None:
+            self.suppressor.forget(row.get("dedup_key") for kind, row in operations if kind == INSERT)
+
+    async def _write_batch(self, operations: list[tuple[str, dict]], ignore_existing: bool = False) -> tuple[int, int]:
+        started = time.perf_counter()
+        async with self.session_factory() as db_session:
+            inserted, updated = await apply_security_event_operations(operations, db_session, ignore_existing)
+        DB_WRITE_SECONDS.observe(time.perf_counter() - started)
+        DB_ROWS.labels("insert").inc(inserted)
+        DB_ROWS.labels("update").inc(updated)
+        return inserted, updated
+
+
+event_writer = EventWriter(
+    suppressor=DetectionSuppressor() if settings.SUPPRESSION_ENABLED else None,
+    rollup=event_rollup if settings.ROLLUP_ENABLED else None,
+    spool=DetectionSpool() if settings.SPOOL_ENABLED else None,
+)
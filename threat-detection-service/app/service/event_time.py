@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timezone
+
+from app.schema.detection import LogRecord
+
+PROCESSING_TIME = "processing"
+EVENT_TIME = "event"
+
+
+def parse_timestamp(value: str) -> float | None:
+    """Parse a log timestamp to epoch seconds.
+
+    Accepts ISO-8601 instants as published by the ingestion service
+    (Instant.toString(), e.g. 2025-01-01T12:00:00.123Z) and epoch numbers in
+    seconds or milliseconds. Naive ISO timestamps are taken as UTC.
+    """
+    if not value:
+        return None
+
+    if value[0].isdigit() and value.replace(".", "", 1).isdigit():
+        number = float(value)
+        return number / 1000 if number > 1e11 else number
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class EventClock:
+    """Time source for stateful rules.
+
+    In processing mode every log is stamped with the wall clock on arrival.
+    In event mode the log's own timestamp is used and a watermark trails the
+    highest event time seen by max_out_of_order_seconds: logs older than the
+    watermark are too late to be placed in their window and are skipped by
+    stateful rules, while anything newer is inserted at its event time.
+    """
+
+    def __init__(self, mode: str = PROCESSING_TIME, max_out_of_order_seconds: float = 30.0):
+        if mode not in (PROCESSING_TIME, EVENT_TIME):
+            raise ValueError(f"Unknown rule time mode: {mode}")
+        self.mode = mode
+        self.max_out_of_order_seconds = max_out_of_order_seconds
+
+        self._max_event_time: float | None = None
+        self._late_events = 0
+        self._unparsable = 0
+
+    @property
+    def watermark(self) -> float | None:
+        """No event older than this will be accepted any more (None in processing mode)."""
+        if self.mode == PROCESSING_TIME or self._max_event_time is None:
+            return None
+        return self._max_event_time - self.max_out_of_order_seconds
+
+    def observe(self, log: LogRecord) -> float | None:
+        """Return the time to evaluate log at, or None if it arrived behind the watermark."""
+        if self.mode == PROCESSING_TIME:
+            return time.time()
+
+        ts = parse_timestamp(log.timestamp)
+        if ts is None:
+            # Without an event time, treat the log as arriving at the head of the stream
+            self._unparsable += 1
+            if self._max_event_time is None:
+                return time.time()
+            return self._max_event_time
+
+        if self._max_event_time is None or ts > self._max_event_time:
+            self._max_event_time = ts
+        elif ts < self._max_event_time - self.max_out_of_order_seconds:
+            self._late_events += 1
+            return None
+        return ts
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "watermark": self.watermark,
+            "max_out_of_order_seconds": self.max_out_of_order_seconds,
+            "late_events": self._late_events,
+            "unparsable_timestamps": self._unparsable,
+        }
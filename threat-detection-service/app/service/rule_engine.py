@@ -1,14 +1,64 @@
 import re
 import logging
-from collections import defaultdict
-from datetime import datetime, timedelta
+import time
+from collections.abc import Iterable, Iterator
 
-from app.schema.detection import LogMessage, EventType, Severity
+from app.core.config import settings
+from app.core.metrics import RULE_SECONDS, sample_rule_timing
+from app.schema.detection import LogRecord, EventType, Severity
+from app.service.event_time import EventClock, EVENT_TIME
+from app.service.window_store import SlidingWindowStore
+from app.service.sketches import RollingDistinctCounter
 
 logger = logging.getLogger(__name__)
 
+# Brute force: BRUTE_FORCE_THRESHOLD+ failures from same IP within the window
+BRUTE_FORCE_WINDOW_SECONDS = 300
+BRUTE_FORCE_THRESHOLD = 5
+
+# Path scanning: PATH_SCAN_THRESHOLD+ distinct endpoints requested by one IP within the window
+PATH_SCAN_WINDOW_SECONDS = 300
+PATH_SCAN_THRESHOLD = 50
+
+# Password spraying: failed logins for PASSWORD_SPRAY_THRESHOLD+ distinct users from one IP within the window
+PASSWORD_SPRAY_WINDOW_SECONDS = 300
+PASSWORD_SPRAY_THRESHOLD = 10
+
+
+def _create_login_failure_store() -> SlidingWindowStore:
+    return SlidingWindowStore(
+        window_seconds=BRUTE_FORCE_WINDOW_SECONDS,
+        max_keys=settings.RULE_STATE_MAX_KEYS,
+        max_bytes=settings.RULE_STATE_MAX_BYTES,
+        key_ttl_seconds=settings.RULE_STATE_KEY_TTL_SECONDS or None,
+    )
+
+
+def _create_distinct_counter(window_seconds: int, threshold: int) -> RollingDistinctCounter:
+    # Keys are tracked exactly up to a fifth of the threshold in distinct items, then by HyperLogLogs
+    return RollingDistinctCounter(
+        window_seconds=window_seconds,
+        panes=5,
+        min_items=max(threshold // 5, 1),
+        max_keys=settings.SKETCH_MAX_KEYS,
+        precision=settings.SKETCH_HLL_PRECISION,
+    )
+
+
+# Time source for stateful rules (wall clock or LogRecord.timestamp)
+_clock = EventClock(settings.RULE_TIME_MODE, settings.EVENT_TIME_MAX_OUT_OF_ORDER_SECONDS)
+
 # In-memory store for brute force tracking
-_login_failures: dict[str, list[datetime]] = defaultdict(list)
+_login_failures = _create_login_failure_store()
+
+# With the Redis backend, check_brute_force defers login failures here and they are counted per batch
+# in windows shared by all replicas (shared_windows.py); _login_failures keeps the local fallback count
+_shared_brute_force = settings.RULE_STATE_BACKEND == "redis"
+_deferred_login_failures: list[tuple[LogRecord, str, float, int]] = []
+
+# Sketches of distinct endpoints / failed-login users per IP
+_endpoints_per_ip = _create_distinct_counter(PATH_SCAN_WINDOW_SECONDS, PATH_SCAN_THRESHOLD)
+_users_per_ip = _create_distinct_counter(PASSWORD_SPRAY_WINDOW_SECONDS, PASSWORD_SPRAY_THRESHOLD)
 
 # SQL injection patterns
 SQL_INJECTION_PATTERNS = [
@@ -25,30 +75,70 @@ SQL_INJECTION_PATTERNS = [
     r"('\s*--)",
 ]
 
+# Literal prefilter, casefolded: each pattern above starts with one of these
+# keywords and also needs the listed literals somewhere in the line. A line
+# with no keyword whose literals are all present cannot match any pattern.
+SQL_INJECTION_KEYWORDS = {
+    "'": (),
+    "union": ("select",),
+    "drop": ("table",),
+    ";": ("--",),
+    "insert": ("into",),
+    "delete": ("from",),
+    "update": ("set",),
+    "xp_cmdshell": (),
+    "exec": ("(",),
+    "waitfor": ("delay",),
+}
+_SQL_INJECTION_PREFILTER = re.compile("|".join(re.escape(keyword) for keyword in SQL_INJECTION_KEYWORDS))
+
+# re.IGNORECASE also matches dotless i against "I"; casefold() leaves it as is
+_IGNORECASE_FOLDS = str.maketrans({"\u0131": "i"})
+
+# All patterns combined into one alternation; group "p<i>" maps back to SQL_INJECTION_PATTERNS[i]
+_SQL_INJECTION_REGEX = re.compile(
+    "|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(SQL_INJECTION_PATTERNS)),
+    re.IGNORECASE,
+)
+
 # Admin endpoints pattern
 ADMIN_PATH_PATTERN = r"^/admin(/|$)"
 
 
-def check_brute_force(log: LogMessage) -> dict | None:
-    """Detect brute force login attempts: 5+ failures from same IP in 5 minutes."""
-    if "login" not in log.message.lower() or "fail" not in log.message.lower():
+def _is_login_failure(log: LogRecord) -> bool:
+    message = log.message.lower()
+    return "login" in message and "fail" in message
+
+
+def check_brute_force(log: LogRecord, now: float | None = None) -> dict | None:
+    """Detect brute force login attempts: 5+ failures from same IP in 5 minutes.
+
+    now is the log's time from the rule clock; run_all_rules passes it so the
+    timestamp is only parsed once per log. With shared windows the failure is
+    deferred to take_login_failures() and None is returned.
+    """
+    if not _is_login_failure(log):
         return None
 
     ip = log.source_ip
     if not ip:
         return None
 
-    now = datetime.utcnow()
-    window = timedelta(minutes=5)
+    if now is None:
+        now = _clock.observe(log)
+        if now is None:
+            return None
 
-    # Add current failure
-    _login_failures[ip].append(now)
+    # Add current failure; entries older than the window are expired on insert
+    count = _login_failures.add(ip, now, _clock.watermark)
+    if _shared_brute_force:
+        _deferred_login_failures.append((log, ip, now, count))
+        return None
+    return _brute_force_result(ip, count)
 
-    # Clean old entries
-    _login_failures[ip] = [t for t in _login_failures[ip] if now - t <= window]
 
-    count = len(_login_failures[ip])
-    if count >= 5:
+def _brute_force_result(ip: str, count: int) -> dict | None:
+    if count >= BRUTE_FORCE_THRESHOLD:
         logger.warning(f"Brute force detected: IP={ip}, failures={count}")
         return {
             "event_type": EventType.BRUTE_FORCE,
@@ -60,24 +150,126 @@ def check_brute_force(log: LogMessage) -> dict | None:
     return None
 
 
-def check_sql_injection(log: LogMessage) -> dict | None:
+def take_login_failures(logs: list[LogRecord]) -> list[tuple[int, str, float, int]]:
+    """Login failures deferred while running the rules over logs, as (position, source IP, rule time, local count).
+
+    The local count is what check_brute_force would have seen in this
+    process; it is the fallback when the shared windows are unavailable.
+    """
+    global _deferred_login_failures
+
+    deferred, _deferred_login_failures = _deferred_login_failures, []
+    positions = {id(log): i for i, log in enumerate(logs)}
+    return [(positions[id(log)], ip, now, count) for log, ip, now, count in deferred]
+
+
+def brute_force_results(
+    logs: list[LogRecord], failures: list[tuple[int, str, float, int]], counts: list[int],
+) -> list[list[dict]]:
+    """Brute force detections per log of a batch, from each failure's count in the shared window."""
+    results: list[list[dict]] = [[] for _ in logs]
+    for (i, ip, _, _), count in zip(failures, counts):
+        result = _brute_force_result(ip, count)
+        if result:
+            result["rule"] = check_brute_force.__name__
+            results[i] = _annotate(logs[i], [result])
+    return results
+
+
+def check_path_scan(log: LogRecord, now: float | None = None) -> dict | None:
+    """Detect path scanning: 50+ distinct endpoints requested from the same IP in 5 minutes."""
+    if not log.source_ip or not log.endpoint:
+        return None
+
+    if now is None:
+        now = _clock.observe(log)
+        if now is None:
+            return None
+
+    path = log.endpoint.split("?", 1)[0]
+    distinct = _endpoints_per_ip.add(log.source_ip, path, now)
+    if distinct is not None and distinct >= PATH_SCAN_THRESHOLD:
+        logger.warning(f"Path scan detected: IP={log.source_ip}, endpoints~{distinct:.0f}")
+        return {
+            "event_type": EventType.ANOMALY,
+            "severity": Severity.MEDIUM,
+            "description": f"Path scanning detected: ~{distinct:.0f} distinct endpoints requested from {log.source_ip} within 5 minutes",
+            "confidence": min(distinct / (2 * PATH_SCAN_THRESHOLD), 1.0),
+        }
+
+    return None
+
+
+def check_password_spray(log: LogRecord, now: float | None = None) -> dict | None:
+    """Detect password spraying: failed logins for 10+ distinct users from the same IP in 5 minutes."""
+    if not log.source_ip or not log.user_id or not _is_login_failure(log):
+        return None
+
+    if now is None:
+        now = _clock.observe(log)
+        if now is None:
+            return None
+
+    distinct = _users_per_ip.add(log.source_ip, log.user_id, now)
+    if distinct is not None and distinct >= PASSWORD_SPRAY_THRESHOLD:
+        logger.warning(f"Password spraying detected: IP={log.source_ip}, users~{distinct:.0f}")
+        return {
+            "event_type": EventType.BRUTE_FORCE,
+            "severity": Severity.HIGH,
+            "description": f"Password spraying detected: failed logins for ~{distinct:.0f} distinct users from {log.source_ip} within 5 minutes",
+            "confidence": min(distinct / (2 * PASSWORD_SPRAY_THRESHOLD), 1.0),
+        }
+
+    return None
+
+
+def match_sql_injection(text: str) -> str | None:
+    """Return the SQL injection pattern that matches text, or None.
+
+    Benign lines are rejected by the keyword prefilter; otherwise the combined
+    regex is run once, starting at the earliest position a pattern could match.
+    """
+    folded = text.casefold()
+    is_ascii = text.isascii()
+    if not is_ascii:
+        folded = folded.translate(_IGNORECASE_FOLDS)
+
+    pos = 0
+    while True:
+        keyword = _SQL_INJECTION_PREFILTER.search(folded, pos)
+        if keyword is None:
+            return None
+        if all(literal in folded for literal in SQL_INJECTION_KEYWORDS[keyword.group()]):
+            break
+        pos = keyword.start() + 1
+
+    # casefold() can change string length outside ASCII, so offsets only carry over for ASCII text
+    match = _SQL_INJECTION_REGEX.search(text, keyword.start() if is_ascii else 0)
+    if not match:
+        return None
+
+    # The outermost named group closes last, so lastgroup names the alternative that matched
+    return SQL_INJECTION_PATTERNS[int(match.lastgroup[1:])]
+
+
+def check_sql_injection(log: LogRecord) -> dict | None:
     """Detect SQL injection patterns in log messages."""
     text = log.message + " " + (log.endpoint or "")
 
-    for pattern in SQL_INJECTION_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE):
-            logger.warning(f"SQL injection detected: IP={log.source_ip}, pattern={pattern}")
-            return {
-                "event_type": EventType.SQL_INJECTION,
-                "severity": Severity.CRITICAL,
-                "description": f"SQL injection attempt detected from {log.source_ip}: matched pattern '{pattern}'",
-                "confidence": 0.95,
-            }
+    pattern = match_sql_injection(text)
+    if pattern is None:
+        return None
 
-    return None
+    logger.warning(f"SQL injection detected: IP={log.source_ip}, pattern={pattern}")
+    return {
+        "event_type": EventType.SQL_INJECTION,
+        "severity": Severity.CRITICAL,
+        "description": f"SQL injection attempt detected from {log.source_ip}: matched pattern '{pattern}'",
+        "confidence": 0.95,
+    }
 
 
-def check_privilege_escalation(log: LogMessage) -> dict | None:
+def check_privilege_escalation(log: LogRecord) -> dict | None:
     """Detect non-admin users accessing admin endpoints."""
     if not log.endpoint:
         return None
@@ -95,19 +287,98 @@ def check_privilege_escalation(log: LogMessage) -> dict | None:
     return None
 
 
-def run_all_rules(log: LogMessage) -> list[dict]:
+def get_rule_state_stats() -> dict:
+    """Memory/eviction stats of the stateful rules' window stores."""
+    return {
+        "clock": _clock.stats(),
+        "brute_force": {**_login_failures.stats(), "shared": _shared_brute_force},
+        "path_scan": _endpoints_per_ip.stats(),
+        "password_spray": _users_per_ip.stats(),
+    }
+
+
+def reset_rule_state(time_mode: str | None = None, shared_brute_force: bool | None = None):
+    """Drop all stateful rule state (windows, sketches, event-time watermark), optionally switching time mode
+    or the brute force backend (shared_brute_force=False checks it per log in this process)."""
+    global _clock, _login_failures, _endpoints_per_ip, _users_per_ip, _shared_brute_force
+
+    if shared_brute_force is not None:
+        _shared_brute_force = shared_brute_force
+    _clock = EventClock(time_mode or _clock.mode, _clock.max_out_of_order_seconds)
+    _login_failures = _create_login_failure_store()
+    _endpoints_per_ip = _create_distinct_counter(PATH_SCAN_WINDOW_SECONDS, PATH_SCAN_THRESHOLD)
+    _users_per_ip = _create_distinct_counter(PASSWORD_SPRAY_WINDOW_SECONDS, PASSWORD_SPRAY_THRESHOLD)
+
+
+def run_all_rules(log: LogRecord) -> list[dict]:
     """Run all detection rules against a log entry."""
     results = []
 
-    checks = [check_brute_force, check_sql_injection, check_privilege_escalation]
+    # Stateful rules share one clock reading; None means the log is behind the watermark
+    now = _clock.observe(log)
+    stateful_checks = [check_brute_force, check_path_scan, check_password_spray] if now is not None else []
+    checks = [check_sql_injection, check_privilege_escalation]
+
+    if sample_rule_timing():
+        return _run_timed(log, now, stateful_checks, checks)
+
+    for check in stateful_checks:
+        result = check(log, now)
+        if result:
+            result["rule"] = check.__name__
+            results.append(result)
 
     for check in checks:
         result = check(log)
         if result:
-            result["log_entry_id"] = log.id
-            result["source_ip"] = log.source_ip
-            result["detected_by"] = "RULE"
-            result["raw_log"] = log.message
+            result["rule"] = check.__name__
             results.append(result)
 
+    return _annotate(log, results)
+
+
+def _annotate(log: LogRecord, results: list[dict]) -> list[dict]:
+    for result in results:
+        result["log_entry_id"] = log.id
+        result["source_ip"] = log.source_ip
+        result["detected_by"] = "RULE"
+        result["raw_log"] = log.message
+
     return results
+
+
+def _run_timed(log: LogRecord, now: float | None, stateful_checks: list, checks: list) -> list[dict]:
+    """run_all_rules for a sampled log, observing each rule's evaluation time."""
+    results = []
+    for check in stateful_checks + checks:
+        started = time.perf_counter()
+        result = check(log, now) if check in stateful_checks else check(log)
+        RULE_SECONDS.labels(check.__name__).observe(time.perf_counter() - started)
+        if result:
+            result["rule"] = check.__name__
+            results.append(result)
+    return _annotate(log, results)
+
+
+def replay_logs(logs: Iterable[LogRecord]) -> Iterator[tuple[LogRecord, list[dict]]]:
+    """Run stored logs through run_all_rules in event-time mode, as fast as they can be read.
+
+    Uses a fresh clock and fresh rule state, so windows follow the logs' own
+    timestamps instead of collapsing into the replay's wall-clock time. Brute
+    force is always checked in-process, never against the shared windows. The
+    live state is restored when the generator finishes; do not replay while
+    the stream consumer is running in the same process.
+    """
+    global _clock, _login_failures, _endpoints_per_ip, _users_per_ip, _shared_brute_force
+
+    live_state = _clock, _login_failures, _endpoints_per_ip, _users_per_ip, _shared_brute_force
+    _shared_brute_force = False
+    _clock = EventClock(EVENT_TIME, settings.EVENT_TIME_MAX_OUT_OF_ORDER_SECONDS)
+    _login_failures = _create_login_failure_store()
+    _endpoints_per_ip = _create_distinct_counter(PATH_SCAN_WINDOW_SECONDS, PATH_SCAN_THRESHOLD)
+    _users_per_ip = _create_distinct_counter(PASSWORD_SPRAY_WINDOW_SECONDS, PASSWORD_SPRAY_THRESHOLD)
+    try:
+        for log in logs:
+            yield log, run_all_rules(log)
+    finally:
+        _clock, _login_failures, _endpoints_per_ip, _users_per_ip, _shared_brute_force = live_state
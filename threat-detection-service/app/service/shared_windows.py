@@ -0,0 +1,142 @@
+import logging
+import math
+import uuid
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.schema.detection import LogRecord
+from app.service.rule_engine import BRUTE_FORCE_WINDOW_SECONDS, brute_force_results
+
+logger = logging.getLogger(__name__)
+
+# KEYS: one sorted set per window key.
+# ARGV: window seconds, TTL seconds, max entries per key, member prefix, then for each key
+#       its number of new timestamps followed by the timestamps.
+# Returns, for every timestamp in argument order, the key's count in the window ending at it.
+_ADD_SCRIPT = """
+local window = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local max_entries = tonumber(ARGV[3])
+local prefix = ARGV[4]
+local arg = 5
+local counts = {}
+for i, key in ipairs(KEYS) do
+    local n = tonumber(ARGV[arg])
+    local first = arg + 1
+    local newest = -math.huge
+    for j = first, first + n - 1 do
+        local ts = tonumber(ARGV[j])
+        redis.call('ZADD', key, ts, prefix .. ':' .. j)
+        if ts > newest then newest = ts end
+    end
+    for j = first, first + n - 1 do
+        local ts = tonumber(ARGV[j])
+        counts[#counts + 1] = redis.call('ZCOUNT', key, ts - window, ts)
+    end
+    -- Expire and trim only after counting, so older timestamps of the batch see their full window
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. (newest - window))
+    redis.call('ZREMRANGEBYRANK', key, 0, -max_entries - 1)
+    redis.call('EXPIRE', key, ttl)
+    arg = first + n
+end
+return counts
+"""
+
+
+class RedisSlidingWindows:
+    """Per-key sliding windows of timestamps in Redis sorted sets, shared by every replica.
+
+    A batch of (key, timestamp) occurrences is grouped by key and written by
+    one Lua script call (EVALSHA), which adds the timestamps, expires entries
+    that fell out of the window, and returns the count in the window ending
+    at each timestamp, atomically with respect to other replicas. Keys keep
+    at most max_entries timestamps (counts above that are a lower bound) and
+    expire once idle for a window. Replicas' clocks are assumed to be in sync
+    (processing-time mode uses each one's wall clock).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float,
+        key_prefix: str = settings.SHARED_WINDOW_KEY_PREFIX,
+        max_entries: int = settings.SHARED_WINDOW_MAX_ENTRIES,
+    ):
+        self.window_seconds = window_seconds
+        self.key_prefix = f"{key_prefix}{name}:"
+        self.max_entries = max_entries
+
+        # Members must be unique across replicas and calls: timestamps alone can repeat
+        self._member_prefix = uuid.uuid4().hex[:12]
+        self._calls = 0
+        self._script = None
+        self._occurrences = 0
+        self._failures = 0
+
+    async def add_batch(self, r: aioredis.Redis, occurrences: list[tuple[str, float]]) -> list[int]:
+        """Record occurrences and return each one's count in the window ending at its timestamp, in input order."""
+        if not occurrences:
+            return []
+        if self._script is None:
+            self._script = r.register_script(_ADD_SCRIPT)
+
+        # Local pre-aggregation: one script argument group per key, however many occurrences it has
+        by_key: dict[str, list[int]] = {}
+        for i, (key, _) in enumerate(occurrences):
+            by_key.setdefault(key, []).append(i)
+
+        args = [
+            self.window_seconds,
+            math.ceil(self.window_seconds) + 60,
+            self.max_entries,
+            f"{self._member_prefix}:{self._calls}",
+        ]
+        order = []
+        for positions in by_key.values():
+            args.append(len(positions))
+            args.extend(repr(occurrences[i][1]) for i in positions)
+            order.extend(positions)
+        self._calls += 1
+
+        try:
+            flat = await self._script(keys=[self.key_prefix + key for key in by_key], args=args, client=r)
+        except redis.RedisError:
+            self._failures += 1
+            raise
+        self._occurrences += len(occurrences)
+
+        counts = [0] * len(occurrences)
+        for i, count in zip(order, flat):
+            counts[i] = int(count)
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "key_prefix": self.key_prefix,
+            "window_seconds": self.window_seconds,
+            "script_calls": self._calls,
+            "occurrences": self._occurrences,
+            "failed_calls": self._failures,
+        }
+
+
+async def check_brute_force_shared(
+    r: aioredis.Redis, logs: list[LogRecord], failures: list[tuple[int, str, float, int]],
+) -> list[list[dict]]:
+    """Brute force detections per log of a batch for its deferred login failures, counted across all replicas.
+
+    Falls back to this process's own window counts if Redis fails, so a
+    Redis outage degrades detection to per-replica instead of stopping it.
+    """
+    try:
+        counts = await shared_login_failures.add_batch(r, [(ip, now) for _, ip, now, _ in failures])
+    except redis.RedisError as e:
+        logger.warning(f"Shared brute force windows unavailable, using local counts: {e}")
+        counts = [local for _, _, _, local in failures]
+
+    return brute_force_results(logs, failures, counts)
+
+
+shared_login_failures = RedisSlidingWindows("login-failures", BRUTE_FORCE_WINDOW_SECONDS)
@@ -0,0 +1,181 @@
+import math
+from collections import OrderedDict
+
+_HASH_MASK = (1 << 64) - 1
+
+
+def _hash64(value: str) -> int:
+    # str hashing is salted per process; sketches never leave the process that built them
+    return hash(value) & _HASH_MASK
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2^precision one-byte registers (~1.04/sqrt(2^p) relative error)."""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: str) -> bool:
+        """Add item; returns True if the sketch changed (the item may be new)."""
+        h = _hash64(item)
+        index = h & ((1 << self.precision) - 1)
+        rest = h >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    @staticmethod
+    def count_union(sketches: list["HyperLogLog"]) -> float:
+        """Estimated distinct items across sketches of equal precision."""
+        registers = sketches[0].registers if len(sketches) == 1 else bytes(map(max, *(s.registers for s in sketches)))
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            return m * math.log(m / zeros)
+        return estimate
+
+
+class RollingDistinctCounter:
+    """Distinct items per key over a rolling window, in bounded memory.
+
+    The window is split into panes. A key's items are first kept exactly, as
+    item -> last pane seen, until it has min_items distinct items in the
+    window; it is then switched to one HyperLogLog per pane, seeded with
+    those items, and the window estimate is the union of its live panes'
+    HyperLogLogs. So the many keys with few items cost a small dict and
+    a couple of dict operations per event, and only busy keys pay for
+    sketches. At most max_keys keys are kept exactly and max_keys
+    HyperLogLogs per pane (least recently used are evicted). Panes older
+    than the window are dropped whole.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        panes: int,
+        min_items: int,
+        max_keys: int,
+        precision: int,
+    ):
+        self.window_seconds = window_seconds
+        self.pane_seconds = window_seconds / panes
+        self.panes = panes
+        self.min_items = min_items
+        self.max_keys = max_keys
+        self.precision = precision
+
+        # pane id -> key -> HyperLogLog of the key's items in that pane
+        self._panes: dict[int, OrderedDict[str, HyperLogLog]] = {}
+        # key -> newest pane holding a HyperLogLog for it
+        self._sketched: dict[str, int] = {}
+        # key -> {item: last pane seen}, for keys not (or no longer) sketched
+        self._exact: OrderedDict[str, dict[str, int]] = OrderedDict()
+        self._latest: int | None = None
+        self._evictions = 0
+
+    def add(self, key: str, item: str, ts: float) -> float | None:
+        """Record item for key at ts.
+
+        Returns the key's estimated distinct items in the window when this
+        item changed the estimate, otherwise None (always None while the key
+        has fewer than min_items distinct items).
+        """
+        pane_id = int(ts // self.pane_seconds)
+        if self._latest is None or pane_id > self._latest:
+            self._advance(pane_id)
+        elif pane_id <= self._latest - self.panes:
+            return None
+
+        if self._sketched.get(key, pane_id - self.panes) > self._latest - self.panes:
+            sketch = self._sketch(key, pane_id)
+            if not sketch.add(item):
+                return None
+            return self._estimate(key)
+
+        items = self._exact.get(key)
+        if items is None:
+            items = self._exact[key] = {}
+            if len(self._exact) > self.max_keys:
+                self._exact.popitem(last=False)
+                self._evictions += 1
+        else:
+            self._exact.move_to_end(key)
+        if items.get(item, pane_id) <= pane_id:
+            items[item] = pane_id
+        if len(items) < self.min_items:
+            return None
+
+        # Enough items to switch to sketches, unless some have left the window since
+        cutoff = self._latest - self.panes
+        for old in [i for i, pane in items.items() if pane <= cutoff]:
+            del items[old]
+        if len(items) < self.min_items:
+            return None
+
+        del self._exact[key]
+        for seen, pane in items.items():
+            self._sketch(key, pane).add(seen)
+        return self._estimate(key)
+
+    def clear(self):
+        self._panes.clear()
+        self._sketched.clear()
+        self._exact.clear()
+        self._latest = None
+
+    def stats(self) -> dict:
+        tracked = sum(len(p) for p in self._panes.values())
+        exact_items = sum(len(items) for items in self._exact.values())
+        return {
+            "panes": len(self._panes),
+            "tracked_keys": tracked,
+            "exact_keys": len(self._exact),
+            "evictions": self._evictions,
+            # Rough: registers per HyperLogLog, a dict slot and a shared item string per exact item
+            "bytes": tracked * (1 << self.precision) + exact_items * 64,
+            "max_keys": self.max_keys,
+        }
+
+    def _advance(self, pane_id: int):
+        self._latest = pane_id
+        cutoff = pane_id - self.panes
+        for old in [p for p in self._panes if p <= cutoff]:
+            del self._panes[old]
+        if len(self._sketched) and min(self._sketched.values()) <= cutoff:
+            self._sketched = {key: pane for key, pane in self._sketched.items() if pane > cutoff}
+
+        # Least recently touched first: drop exact keys until one still has an item in the window
+        while self._exact:
+            key, items = next(iter(self._exact.items()))
+            if max(items.values()) > cutoff:
+                break
+            del self._exact[key]
+
+    def _sketch(self, key: str, pane_id: int) -> HyperLogLog:
+        pane = self._panes.get(pane_id)
+        if pane is None:
+            pane = self._panes[pane_id] = OrderedDict()
+
+        sketch = pane.get(key)
+        if sketch is None:
+            sketch = pane[key] = HyperLogLog(self.precision)
+            if len(pane) > self.max_keys:
+                pane.popitem(last=False)
+                self._evictions += 1
+            if pane_id > self._sketched.get(key, pane_id - 1):
+                self._sketched[key] = pane_id
+        else:
+            pane.move_to_end(key)
+        return sketch
+
+    def _estimate(self, key: str) -> float:
+        return HyperLogLog.count_union([p[key] for p in self._panes.values() if key in p])
@@ -0,0 +1,223 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".ndjson"
+_DEAD_LETTER_PREFIX = "deadletter-"
+# Operation row keys holding datetimes (see suppression.py)
+_DATETIME_KEYS = ("last_seen_at", "created_at")
+
+
+class SpoolFull(Exception):
+    pass
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def _dumps(operations: list[tuple[str, dict]]) -> bytes:
+    return b"".join(
+        json.dumps(operation, default=_encode, ensure_ascii=False).encode() + b"\n" for operation in operations
+    )
+
+
+def _decode(line: bytes) -> tuple[str, dict]:
+    kind, row = json.loads(line)
+    for key in _DATETIME_KEYS:
+        if row.get(key):
+            row[key] = datetime.fromisoformat(row[key])
+    return kind, row
+
+
+class DetectionSpool:
+    """Append-only on-disk spool of security event operations, in segment files.
+
+    Operations ((kind, row) pairs from the event writer) are appended as
+    NDJSON lines to the active segment, one write and one fsync per batch.
+    The active segment is sealed once it reaches segment_bytes (or when the
+    drainer has caught up with every sealed one), and sealed segments are
+    read back oldest first. Progress through a segment is checkpointed next
+    to it, so after a crash at most one drain chunk is replayed again.
+    Operations the database keeps rejecting are moved to a dead-letter file
+    per segment (deadletter-<seq>.ndjson, same format) for inspection.
+
+    One process per directory: the directory is locked while open.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.SPOOL_DIR,
+        segment_bytes: int = settings.SPOOL_SEGMENT_BYTES,
+        max_bytes: int = settings.SPOOL_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+
+        # The writer appends from one thread while the drainer reads, seals and removes from another
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._sealed: list[int] = []
+        self._active = None
+        self._active_seq: int | None = None
+        self._active_bytes = 0
+        self._next_seq = 0
+        self._bytes = 0
+        self._appended = 0
+        self._drained = 0
+        self._dead_lettered = 0
+
+    def open(self):
+        """Lock the directory and pick up segments left by a previous run."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.directory / "spool.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"spool directory {self.directory} is used by another process")
+
+        self._sealed = sorted(
+            int(path.name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+            for path in self.directory.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}")
+        )
+        self._next_seq = self._sealed[-1] + 1 if self._sealed else 0
+        self._bytes = sum(self._path(seq).stat().st_size - self._checkpoint(seq) for seq in self._sealed)
+        if self._sealed:
+            logger.warning(f"Spool has {len(self._sealed)} segments ({self._bytes} bytes) from a previous run")
+        dead_letters = list(self.directory.glob(f"{_DEAD_LETTER_PREFIX}*{_SEGMENT_SUFFIX}"))
+        if dead_letters:
+            logger.warning(f"Spool directory has {len(dead_letters)} dead-letter files")
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+                if self._active_bytes:
+                    self._sealed.append(self._active_seq)
+                else:
+                    self._path(self._active_seq).unlink(missing_ok=True)
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    @property
+    def empty(self) -> bool:
+        return not self._sealed and not self._active_bytes
+
+    def append(self, operations: list[tuple[str, dict]]):
+        """Durably append operations (blocking: one write and one fsync)."""
+        data = _dumps(operations)
+        with self._lock:
+            if self._bytes + len(data) > self.max_bytes:
+                raise SpoolFull(f"spool is full ({self._bytes} bytes)")
+
+            if self._active is None:
+                self._active_seq = self._next_seq
+                self._next_seq += 1
+                self._active = open(self._path(self._active_seq), "ab")
+                self._active_bytes = 0
+
+            self._active.write(data)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active_bytes += len(data)
+            self._bytes += len(data)
+            self._appended += len(operations)
+
+            if self._active_bytes >= self.segment_bytes:
+                self._seal()
+
+    def seal_active(self):
+        """Make the active segment readable by the drainer; later appends start a new one."""
+        with self._lock:
+            if self._active is not None and self._active_bytes:
+                self._seal()
+
+    def oldest(self) -> int | None:
+        with self._lock:
+            return self._sealed[0] if self._sealed else None
+
+    def read(self, seq: int) -> tuple[int, list[tuple[int, tuple[str, dict]]]]:
+        """Checkpointed offset of a sealed segment, and its undrained operations each with the offset after it."""
+        operations = []
+        with open(self._path(seq), "rb") as f:
+            start = self._checkpoint(seq)
+            f.seek(start)
+            offset = start
+            for line in f:
+                offset += len(line)
+                try:
+                    operations.append((offset, _decode(line)))
+                except (ValueError, TypeError) as e:
+                    # A torn last line from a crash mid-append; that batch was never acknowledged
+                    logger.warning(f"Skipping unreadable spool record in segment {seq} at offset {offset}: {e}")
+        return start, operations
+
+    def commit(self, seq: int, start: int, end: int, count: int):
+        """Record that the segment's operations up to offset end (from start) are in the database."""
+        self._checkpoint_path(seq).write_text(str(end))
+        with self._lock:
+            self._bytes -= end - start
+            self._drained += count
+
+    def dead_letter(self, seq: int, operations: list[tuple[str, dict]]):
+        """Durably copy operations of a segment to its dead-letter file (before they are committed past)."""
+        with open(self.directory / f"{_DEAD_LETTER_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}", "ab") as f:
+            f.write(_dumps(operations))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._dead_lettered += len(operations)
+
+    def remove(self, seq: int):
+        """Delete a drained segment (and whatever unreadable records were left in it)."""
+        left = self._path(seq).stat().st_size - self._checkpoint(seq)
+        with self._lock:
+            self._sealed.remove(seq)
+            self._bytes -= left
+        self._path(seq).unlink(missing_ok=True)
+        self._checkpoint_path(seq).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "directory": str(self.directory),
+            "segments": len(self._sealed) + (1 if self._active_bytes else 0),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "appended_operations": self._appended,
+            "drained_operations": self._drained,
+            "dead_letter_operations": self._dead_lettered,
+        }
+
+    def _seal(self):
+        self._active.close()
+        self._active = None
+        self._sealed.append(self._active_seq)
+        self._active_bytes = 0
+
+    def _path(self, seq: int) -> Path:
+        return self.directory / f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}"
+
+    def _checkpoint_path(self, seq: int) -> Path:
+        return self.directory / f"{_SEGMENT_PREFIX}{seq:012d}.offset"
+
+    def _checkpoint(self, seq: int) -> int:
+        try:
+            return int(self._checkpoint_path(seq).read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
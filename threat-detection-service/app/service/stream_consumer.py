@@ -1,32 +1,61 @@
 import asyncio
 import logging
+import os
+import socket
+import time
 import redis
+import redis.asyncio as aioredis
 
 from app.core.config import settings
-from app.schema.detection import LogMessage
-from app.service.rule_engine import run_all_rules
-from app.service.ai_analyzer import analyze_with_llm
-from app.service.event_store import save_security_event
+from app.core.metrics import LOGS_CONSUMED, set_runtime_gauge, clear_runtime_gauge
+from app.schema.detection import LogMessage, LogRecord
+from app.service.rule_engine import run_all_rules, take_login_failures
+from app.service.shared_windows import check_brute_force_shared
+from app.service.event_store import event_writer
+from app.service.ai_scheduler import ai_scheduler
+from app.service.template_miner import template_sampler
+from app.service.anomaly_detector import anomaly_detector
+from app.service import detection_pool
 
 logger = logging.getLogger(__name__)
 
-# Buffer for AI batch analysis
-_log_buffer: list[LogMessage] = []
-AI_BATCH_SIZE = 10
+# Set by stop_consumer(); the loop exits after finishing its current batch
+_stop_requested = asyncio.Event()
 
+# Shared connection pool: the blocking read, acks and pending-list calls each borrow a connection
+_redis_pool: aioredis.ConnectionPool | None = None
 
-def create_redis_client() -> redis.Redis:
-    return redis.Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        decode_responses=True,
-    )
+
+def create_redis_client() -> aioredis.Redis:
+    global _redis_pool
+
+    if _redis_pool is None:
+        _redis_pool = aioredis.ConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            decode_responses=True,
+        )
+    return aioredis.Redis(connection_pool=_redis_pool)
+
+
+async def close_redis_pool():
+    global _redis_pool
+
+    if _redis_pool is not None:
+        await _redis_pool.aclose()
+        _redis_pool = None
 
 
-def ensure_consumer_group(r: redis.Redis):
+def get_consumer_name() -> str:
+    """Consumer name within the group: REDIS_CONSUMER_NAME, or unique per host and process."""
+    return settings.REDIS_CONSUMER_NAME or f"detector-{socket.gethostname()}-{os.getpid()}"
+
+
+async def ensure_consumer_group(r: aioredis.Redis):
     """Create consumer group if it doesn't exist."""
     try:
-        r.xgroup_create(
+        await r.xgroup_create(
             settings.REDIS_STREAM_KEY,
             settings.REDIS_CONSUMER_GROUP,
             id="0",
@@ -40,89 +69,258 @@ def ensure_consumer_group(r: redis.Redis):
             raise
 
 
-def parse_stream_entry(data: dict) -> LogMessage:
-    """Parse Redis Stream entry into LogMessage."""
-    return LogMessage(
-        id=data.get("id", ""),
-        timestamp=data.get("timestamp", ""),
-        source=data.get("source", ""),
-        log_level=data.get("logLevel", "INFO"),
-        message=data.get("message", ""),
-        source_ip=data.get("sourceIp", ""),
-        user_id=data.get("userId", ""),
-        endpoint=data.get("endpoint", ""),
-        method=data.get("method", ""),
-        status_code=data.get("statusCode", ""),
+def parse_stream_entry(data: dict) -> LogRecord:
+    """Parse Redis Stream entry into LogRecord (validated against LogMessage if LOG_STRICT_VALIDATION)."""
+    get = data.get
+    if settings.LOG_STRICT_VALIDATION:
+        message = LogMessage(
+            id=get("id", ""),
+            timestamp=get("timestamp", ""),
+            source=get("source", ""),
+            log_level=get("logLevel", "INFO"),
+            message=get("message", ""),
+            source_ip=get("sourceIp", ""),
+            user_id=get("userId", ""),
+            endpoint=get("endpoint", ""),
+            method=get("method", ""),
+            status_code=get("statusCode", ""),
+        )
+        return LogRecord(**message.__dict__)
+
+    return LogRecord(
+        get("id", ""),
+        get("timestamp", ""),
+        get("source", ""),
+        get("logLevel", "INFO"),
+        get("message", ""),
+        get("sourceIp", ""),
+        get("userId", ""),
+        get("endpoint", ""),
+        get("method", ""),
+        get("statusCode", ""),
     )
 
 
-def _blocking_read(r: redis.Redis):
-    """Blocking Redis read - runs in thread pool to avoid blocking event loop."""
-    return r.xreadgroup(
+async def _read(r: aioredis.Redis):
+    """Blocking XREADGROUP, awaited on the event loop."""
+    return await r.xreadgroup(
         groupname=settings.REDIS_CONSUMER_GROUP,
-        consumername=settings.REDIS_CONSUMER_NAME,
+        consumername=get_consumer_name(),
         streams={settings.REDIS_STREAM_KEY: ">"},
-        count=10,
-        block=3000,
+        count=settings.REDIS_READ_COUNT,
+        block=settings.REDIS_READ_BLOCK_MS,
     )
 
 
-async def process_log(log: LogMessage, db_session):
-    """Process a single log entry through rule engine."""
-    detections = run_all_rules(log)
+async def _ack(r: aioredis.Redis, msg_ids: list[str]):
+    """Acknowledge messages with a single pipelined XACK."""
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.xack(settings.REDIS_STREAM_KEY, settings.REDIS_CONSUMER_GROUP, *msg_ids)
+        await pipe.execute()
 
+
+async def _submit_detections(detections: list[dict]) -> list[asyncio.Future]:
+    persisted = []
     for detection in detections:
-        await save_security_event(detection, db_session)
+        persisted.append(await event_writer.submit(detection))
         logger.info(f"Security event created: type={detection['event_type']}, severity={detection['severity']}")
+    return persisted
+
+
+async def detect_anomalies(logs: list[LogRecord]) -> list[asyncio.Future]:
+    """Score logs against per-IP/endpoint/status rate baselines (one vectorized pass per batch)."""
+    if not settings.ANOMALY_DETECTION_ENABLED:
+        return []
+    return await _submit_detections(anomaly_detector.observe(logs))
 
-    _log_buffer.append(log)
 
+async def process_log(log: LogRecord, detections: list[dict] | None = None) -> list[asyncio.Future]:
+    """Process a single log entry through rule engine.
 
-async def flush_ai_buffer(db_session):
-    """Send buffered logs to AI for analysis."""
-    global _log_buffer
+    detections can be passed in when the rules already ran elsewhere (worker
+    processes). Returns one future per detection, resolved once it is persisted.
+    """
+    if detections is None:
+        detections = run_all_rules(log)
 
-    if not _log_buffer:
+    persisted = await _submit_detections(detections)
+
+    # Repeats of well-known log templates are only sampled for the LLM
+    if not settings.TEMPLATE_MINER_ENABLED or template_sampler.should_analyze(log):
+        ai_scheduler.submit(log)
+    return persisted
+
+
+async def process_batch(r: aioredis.Redis, messages: list[tuple[str, dict]]):
+    """Process a micro-batch and acknowledge it once its detections are durably persisted.
+
+    If persisting fails the batch is left unacknowledged in the pending list.
+    """
+    logs = [parse_stream_entry(data) for _, data in messages]
+    pool = detection_pool.detection_pool
+    if pool is not None:
+        batch_detections, login_failures = await pool.run_batch(logs)
+    else:
+        batch_detections = [run_all_rules(log) for log in logs]
+        login_failures = take_login_failures(logs)
+
+    # Shared brute force windows: one Redis round trip for the whole batch
+    if login_failures:
+        shared = await check_brute_force_shared(r, logs, login_failures)
+        for detections, brute_force in zip(batch_detections, shared):
+            detections[:0] = brute_force
+
+    persisted = []
+    for log, detections in zip(logs, batch_detections):
+        persisted.extend(await process_log(log, detections))
+    persisted.extend(await detect_anomalies(logs))
+
+    if persisted:
+        await event_writer.flush()
+        await asyncio.gather(*persisted)
+
+    await _ack(r, [msg_id for msg_id, _ in messages])
+
+
+async def _handle_messages(r: aioredis.Redis, messages: list[tuple[str, dict]]):
+    LOGS_CONSUMED.inc(len(messages))
+    if settings.CONSUMER_MICRO_BATCH:
+        await process_batch(r, messages)
         return
 
-    logs_to_analyze = _log_buffer.copy()
-    _log_buffer.clear()
+    for msg_id, data in messages:
+        log = parse_stream_entry(data)
+        detections = run_all_rules(log)
+        login_failures = take_login_failures([log])
+        if login_failures:
+            detections[:0] = (await check_brute_force_shared(r, [log], login_failures))[0]
+        await process_log(log, detections)
+        await detect_anomalies([log])
+        await _ack(r, [msg_id])
 
-    ai_detections = await analyze_with_llm(logs_to_analyze)
 
-    for detection in ai_detections:
-        await save_security_event(detection, db_session)
-        logger.info(f"AI detection: type={detection['event_type']}, confidence={detection['confidence']}")
+async def claim_stale_entries(r: aioredis.Redis) -> int:
+    """Take over entries left pending by crashed consumers (XAUTOCLAIM) and process them.
 
+    Only entries idle for REDIS_CLAIM_MIN_IDLE_MS are claimed, so batches a
+    live consumer is still working on are left alone.
+    """
+    claimed = 0
+    start_id = "0-0"
 
-async def consume_logs(db_session):
+    while True:
+        result = await r.xautoclaim(
+            settings.REDIS_STREAM_KEY,
+            settings.REDIS_CONSUMER_GROUP,
+            get_consumer_name(),
+            min_idle_time=settings.REDIS_CLAIM_MIN_IDLE_MS,
+            start_id=start_id,
+            count=settings.REDIS_READ_COUNT,
+        )
+        start_id, messages = result[0], result[1]
+
+        # IDs of pending entries trimmed from the stream (Redis 7+); nothing to process, just settle them
+        deleted = result[2] if len(result) > 2 else []
+        if deleted:
+            await _ack(r, deleted)
+            logger.info(f"Acknowledged {len(deleted)} pending entries deleted from the stream")
+        if messages:
+            await _handle_messages(r, messages)
+            claimed += len(messages)
+
+        if start_id == "0-0":
+            break
+
+    if claimed:
+        logger.info(f"Claimed {claimed} stale pending entries")
+    return claimed
+
+
+async def leave_consumer_group(r: aioredis.Redis):
+    """Remove this consumer from the group if it holds no pending entries.
+
+    Pending entries are kept (not deleted with the consumer) so another
+    consumer can claim them.
+    """
+    name = get_consumer_name()
+    pending = await r.xpending_range(
+        settings.REDIS_STREAM_KEY,
+        settings.REDIS_CONSUMER_GROUP,
+        min="-",
+        max="+",
+        count=1,
+        consumername=name,
+    )
+    if pending:
+        logger.warning(f"Consumer {name} leaving with pending entries; they will be claimed by another consumer")
+        return
+
+    await r.xgroup_delconsumer(settings.REDIS_STREAM_KEY, settings.REDIS_CONSUMER_GROUP, name)
+    logger.info(f"Consumer {name} left group {settings.REDIS_CONSUMER_GROUP}")
+
+
+async def collect_stream_metrics():
+    """Refresh consumer group lag and pending-entry gauges from Redis (called at scrape time)."""
+    r = create_redis_client()
+    groups = await r.xinfo_groups(settings.REDIS_STREAM_KEY)
+    for group in groups:
+        labels = {"group": group["name"]}
+        set_runtime_gauge("aisiem_consumer_group_pending", "Entries delivered but not acknowledged", group["pending"], labels)
+        # lag is reported by Redis >= 7; None when it cannot be computed
+        if group.get("lag") is not None:
+            set_runtime_gauge("aisiem_consumer_group_lag", "Stream entries not yet delivered to the group", group["lag"], labels)
+
+    pending = await r.xpending(settings.REDIS_STREAM_KEY, settings.REDIS_CONSUMER_GROUP)
+    clear_runtime_gauge("aisiem_consumer_pending")
+    for consumer in pending.get("consumers") or []:
+        set_runtime_gauge(
+            "aisiem_consumer_pending", "Pending entries per consumer", consumer["pending"], {"consumer": consumer["name"]},
+        )
+
+
+async def stop_consumer(consumer_task: asyncio.Task):
+    """Let the consumer finish its current batch and leave the group, cancelling it if that takes too long."""
+    _stop_requested.set()
+    timeout = settings.REDIS_READ_BLOCK_MS / 1000 + 10
+    try:
+        await asyncio.wait_for(consumer_task, timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        pass
+
+
+async def consume_logs():
     """Main consumer loop: read from Redis Stream and process logs."""
     r = create_redis_client()
-    ensure_consumer_group(r)
+    await ensure_consumer_group(r)
 
-    logger.info("Starting Redis Stream consumer...")
+    logger.info(f"Starting Redis Stream consumer {get_consumer_name()}...")
 
     # Yield control so uvicorn startup can complete
     await asyncio.sleep(0)
 
-    while True:
+    _stop_requested.clear()
+    next_claim = 0.0
+
+    while not _stop_requested.is_set():
         try:
-            # Run blocking Redis read in thread pool
-            entries = await asyncio.to_thread(_blocking_read, r)
+            if time.monotonic() >= next_claim:
+                next_claim = time.monotonic() + settings.REDIS_CLAIM_INTERVAL_SECONDS
+                await claim_stale_entries(r)
+
+            entries = await _read(r)
 
             if entries:
                 for stream_name, messages in entries:
-                    for msg_id, data in messages:
-                        log = parse_stream_entry(data)
-                        await process_log(log, db_session)
-                        r.xack(settings.REDIS_STREAM_KEY, settings.REDIS_CONSUMER_GROUP, msg_id)
-
-            if len(_log_buffer) >= AI_BATCH_SIZE:
-                await flush_ai_buffer(db_session)
+                    await _handle_messages(r, messages)
 
         except asyncio.CancelledError:
             logger.info("Consumer task cancelled")
-            break
+            return
         except Exception as e:
             logger.error(f"Consumer error: {e}")
             await asyncio.sleep(5)
+
+    try:
+        await leave_consumer_group(r)
+    except Exception as e:
+        logger.error(f"Failed to leave consumer group: {e}")
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.schema.detection import LogRecord
+from app.service.verdict_cache import normalize_text
+
+WILDCARD = "<*>"
+
+
+class LogCluster:
+    __slots__ = ("cluster_id", "template", "count", "leaf")
+
+    def __init__(self, cluster_id: int, template: list[str], leaf: list["LogCluster"]):
+        self.cluster_id = cluster_id
+        self.template = template
+        self.count = 1
+        self.leaf = leaf
+
+    @property
+    def template_text(self) -> str:
+        return " ".join(self.template)
+
+
+class TemplateMiner:
+    """Online log template mining with a Drain-style fixed-depth parse tree.
+
+    Messages are masked (IPs, numbers, IDs, timestamps) and tokenized, then
+    routed by token count and their first depth-2 tokens to a leaf holding a
+    few candidate clusters. The most similar cluster above sim_threshold
+    absorbs the message (differing tokens become <*>), otherwise a new
+    cluster is created. Clusters are evicted least recently used beyond
+    max_clusters.
+    """
+
+    def __init__(
+        self,
+        depth: int = 4,
+        sim_threshold: float = 0.4,
+        max_children: int = 100,
+        max_clusters: int = 10_000,
+    ):
+        self.prefix_depth = max(depth - 2, 1)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+
+        self._root: dict[int, dict] = {}
+        self._clusters: OrderedDict[int, LogCluster] = OrderedDict()
+        self._next_id = 1
+
+    def add(self, message: str) -> tuple[LogCluster, bool]:
+        """Match message to a cluster, creating one if needed.
+
+        Returns (cluster, changed), where changed is True for a new cluster or
+        one whose template was generalized by this message.
+        """
+        tokens = normalize_text(message).split()
+        leaf = self._leaf_for(tokens)
+
+        cluster = self._best_match(leaf, tokens)
+        if cluster is None:
+            cluster = LogCluster(self._next_id, tokens, leaf)
+            self._next_id += 1
+            leaf.append(cluster)
+            self._clusters[cluster.cluster_id] = cluster
+            self._evict()
+            return cluster, True
+
+        cluster.count += 1
+        self._clusters.move_to_end(cluster.cluster_id)
+
+        changed = False
+        template = cluster.template
+        for i, token in enumerate(tokens):
+            if template[i] != token and template[i] != WILDCARD:
+                template[i] = WILDCARD
+                changed = True
+        return cluster, changed
+
+    @property
+    def cluster_count(self) -> int:
+        return len(self._clusters)
+
+    def top_templates(self, limit: int) -> list[dict]:
+        clusters = sorted(self._clusters.values(), key=lambda c: c.count, reverse=True)[:limit]
+        return [{"id": c.cluster_id, "template": c.template_text, "count": c.count} for c in clusters]
+
+    def _leaf_for(self, tokens: list[str]) -> list[LogCluster]:
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_depth]:
+            # Tokens that still carry variable data share a wildcard branch
+            key = WILDCARD if any(ch.isdigit() for ch in token) else token
+            if key not in node:
+                if len(node) >= self.max_children:
+                    key = WILDCARD
+                node = node.setdefault(key, {})
+            else:
+                node = node[key]
+        return node.setdefault(None, [])
+
+    def _best_match(self, leaf: list[LogCluster], tokens: list[str]) -> LogCluster | None:
+        best, best_sim, best_params = None, -1.0, -1
+        for cluster in leaf:
+            same = params = 0
+            for template_token, token in zip(cluster.template, tokens):
+                if template_token == WILDCARD:
+                    params += 1
+                elif template_token == token:
+                    same += 1
+            sim = same / len(tokens) if tokens else 1.0
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best, best_sim, best_params = cluster, sim, params
+        if best is not None and best_sim >= self.sim_threshold:
+            return best
+        return None
+
+    def _evict(self):
+        while len(self._clusters) > self.max_clusters:
+            _, cluster = self._clusters.popitem(last=False)
+            cluster.leaf.remove(cluster)
+
+
+class TemplateSampler:
+    """Decides which logs are worth sending to the LLM, based on their template.
+
+    A log goes to the AI buffer if its template is new or just changed, if the
+    template is still rare (seen at most rare_count times), or as every
+    sample_every-th representative of a common template.
+    """
+
+    def __init__(self, miner: TemplateMiner, rare_count: int, sample_every: int):
+        self.miner = miner
+        self.rare_count = rare_count
+        self.sample_every = sample_every
+
+        self._seen = 0
+        self._selected = 0
+
+    def should_analyze(self, log: LogRecord) -> bool:
+        cluster, changed = self.miner.add(log.message)
+        self._seen += 1
+
+        selected = (
+            changed
+            or cluster.count <= self.rare_count
+            or (self.sample_every > 0 and cluster.count % self.sample_every == 0)
+        )
+        if selected:
+            self._selected += 1
+        return selected
+
+    def stats(self, top: int = 20) -> dict:
+        return {
+            "templates": self.miner.cluster_count,
+            "logs_seen": self._seen,
+            "logs_selected": self._selected,
+            "top_templates": self.miner.top_templates(top),
+        }
+
+
+template_sampler = TemplateSampler(
+    TemplateMiner(
+        depth=settings.TEMPLATE_TREE_DEPTH,
+        sim_threshold=settings.TEMPLATE_SIM_THRESHOLD,
+        max_children=settings.TEMPLATE_MAX_CHILDREN,
+        max_clusters=settings.TEMPLATE_MAX_CLUSTERS,
+    ),
+    rare_count=settings.TEMPLATE_RARE_COUNT,
+    sample_every=settings.TEMPLATE_SAMPLE_EVERY,
+)
@@ -0,0 +1,87 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+from app.schema.detection import LogRecord
+
+# Variable parts of a log line, masked so repeats of the same line share a verdict
+_MASKS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<TS>"),
+    (re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"), "<ID>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b"), "<IP>"),
+    (re.compile(r"\b(?:[0-9a-fA-F]{0,4}:){2,7}[0-9a-fA-F]{0,4}\b"), "<IP>"),
+    (re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"), "<ID>"),
+    (re.compile(r"\d+"), "<NUM>"),
+]
+
+
+def normalize_text(text: str) -> str:
+    for pattern, mask in _MASKS:
+        text = pattern.sub(mask, text)
+    return text
+
+
+def normalize_log(log: LogRecord) -> str:
+    """The parts of a log the LLM sees, minus timestamp/IP, with IDs and numbers masked."""
+    return f"{log.source} | {log.method} {normalize_text(log.endpoint)} | {normalize_text(log.message)}"
+
+
+def verdict_key(log: LogRecord) -> str:
+    return hashlib.blake2b(normalize_log(log).encode(), digest_size=16).hexdigest()
+
+
+class VerdictCache:
+    """LRU + TTL cache of LLM verdicts per normalized log line.
+
+    A verdict is the list of threats the LLM attributed to the line; an empty
+    list means it was analyzed and found clean.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+    def get(self, key: str) -> list[dict] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        expires_at, verdict = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._expired += 1
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return verdict
+
+    def put(self, key: str, verdict: list[dict]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "expired": self._expired,
+        }
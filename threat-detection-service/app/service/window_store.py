@@ -0,0 +1,109 @@
+import sys
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+
+# Rough per-item costs used for the memory ceiling: a float timestamp plus its
+# deque slot, and an empty deque plus its OrderedDict entry.
+_ENTRY_BYTES = sys.getsizeof(0.0) + 8
+_KEY_BYTES = sys.getsizeof(deque()) + 104
+
+
+class SlidingWindowStore:
+    """Per-key sliding windows of timestamps with bounded key count and memory.
+
+    Each key holds a sorted deque of timestamps (seconds). Inserting expires
+    entries that fell out of the window from the head of that key's deque, so
+    in-order insert and expire are O(1) amortized; out-of-order timestamps
+    (event-time mode) are placed by binary search. Keys are kept in LRU order
+    and evicted when idle longer than key_ttl, or when max_keys / max_bytes
+    would be exceeded.
+    """
+
+    def __init__(self, window_seconds: float, max_keys: int, max_bytes: int, key_ttl_seconds: float | None = None):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self.key_ttl_seconds = key_ttl_seconds if key_ttl_seconds is not None else window_seconds
+
+        self._windows: OrderedDict[str, deque[float]] = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._expired = 0
+
+    def add(self, key: str, ts: float, watermark: float | None = None) -> int:
+        """Record an occurrence for key at ts and return the count in the window ending at ts.
+
+        watermark is the time below which no more inserts will arrive; entries
+        are only expired relative to it. It defaults to ts (in-order input).
+        """
+        horizon = ts if watermark is None else min(ts, watermark)
+
+        window = self._windows.get(key)
+        if window is None:
+            window = deque()
+            self._windows[key] = window
+            self._bytes += _KEY_BYTES + sys.getsizeof(key)
+        else:
+            self._windows.move_to_end(key)
+
+        in_order = not window or ts >= window[-1]
+        if in_order:
+            window.append(ts)
+        else:
+            insort(window, ts)
+        self._bytes += _ENTRY_BYTES
+
+        cutoff = horizon - self.window_seconds
+        while window[0] < cutoff:
+            window.popleft()
+            self._bytes -= _ENTRY_BYTES
+
+        start = ts - self.window_seconds
+        if in_order:
+            count = len(window) if window[0] >= start else len(window) - bisect_left(window, start)
+        else:
+            count = bisect_right(window, ts) - bisect_left(window, start)
+
+        self._enforce_limits(horizon)
+        return count
+
+    def count(self, key: str, now: float) -> int:
+        """Number of occurrences for key within the window ending at now."""
+        window = self._windows.get(key)
+        if not window:
+            return 0
+        cutoff = now - self.window_seconds
+        return sum(1 for ts in window if ts >= cutoff)
+
+    def clear(self):
+        self._windows.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "tracked_keys": len(self._windows),
+            "evictions": self._evictions,
+            "expired": self._expired,
+            "bytes": self._bytes,
+            "max_keys": self.max_keys,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _enforce_limits(self, now: float):
+        windows = self._windows
+        idle_cutoff = now - self.key_ttl_seconds
+
+        # LRU order: the oldest key is at the front, so stop at the first one still in use
+        while windows:
+            key, window = next(iter(windows.items()))
+            if window[-1] < idle_cutoff:
+                self._expired += 1
+            elif len(windows) > self.max_keys or self._bytes > self.max_bytes:
+                self._evictions += 1
+            else:
+                break
+            self._drop(key)
+
+    def _drop(self, key: str):
+        window = self._windows.pop(key)
+        self._bytes -= _KEY_BYTES + sys.getsizeof(key) + _ENTRY_BYTES * len(window)
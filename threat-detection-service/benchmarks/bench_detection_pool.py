@@ -0,0 +1,127 @@
+"""
+Detection Pool Benchmark
+========================
+Rule evaluation throughput of a micro-batch pipeline: parsing stream
+entries in the consumer, then running all rules either on the event loop
+or in ShardedRulePool worker processes (DETECTION_WORKERS):
+
+  in_process   parse + run_all_rules on the event loop
+  pool_<n>     parse once, ShardedRulePool(n).run_batch per micro-batch
+
+Worker rule state persists across repetitions; the pool is warmed up with
+one pass before timing, so process start-up is not counted.
+
+Usage (from threat-detection-service/):
+  python benchmarks/bench_detection_pool.py
+  python benchmarks/bench_detection_pool.py --workers 1 2 4 --batch-size 100 --compare benchmarks/results/detection_pool.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bench_rule_engine import MIXES, SERVICE_DIR, build_entries, git_commit
+
+from app.service import rule_engine
+from app.service.detection_pool import ShardedRulePool
+from app.service.stream_consumer import parse_stream_entry
+
+
+def _batches(entries: list[dict], size: int) -> list[list[dict]]:
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+
+def run_in_process(batches: list[list[dict]]):
+    for batch in batches:
+        logs = [parse_stream_entry(entry) for entry in batch]
+        [rule_engine.run_all_rules(log) for log in logs]
+
+
+async def run_pool(pool: ShardedRulePool, batches: list[list[dict]]):
+    for batch in batches:
+        await pool.run_batch([parse_stream_entry(entry) for entry in batch])
+
+
+def best_ns(run, repeat: int, setup=None) -> int:
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        run()
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule evaluation throughput: event loop vs worker processes")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=100, help="Micro-batch size (REDIS_READ_COUNT)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=SERVICE_DIR / "benchmarks" / "results" / "detection_pool.json")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Detections are logged at WARNING by the rules; keep the console for results
+    logging.disable(logging.WARNING)
+    random.seed(args.seed)
+    batches = _batches(build_entries(MIXES["under_attack"], args.count), args.batch_size)
+
+    results = []
+    ns = best_ns(lambda: run_in_process(batches), args.repeat, setup=rule_engine.reset_rule_state)
+    results.append({"target": "in_process", "ns_per_log": round(ns / args.count, 1)})
+
+    for workers in args.workers:
+        pool = ShardedRulePool(workers, rule_log_level=logging.ERROR)
+        try:
+            asyncio.run(run_pool(pool, batches[:10]))
+            ns = best_ns(lambda: asyncio.run(run_pool(pool, batches)), args.repeat)
+        finally:
+            pool.shutdown()
+        results.append({"target": f"pool_{workers}", "ns_per_log": round(ns / args.count, 1)})
+
+    for r in results:
+        r["logs_per_sec"] = round(1e9 / r["ns_per_log"])
+
+    baseline = {}
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        baseline = {r["target"]: r["ns_per_log"] for r in previous["results"]}
+
+    print(f"{'target':<12} {'ns/log':>9} {'logs/sec':>11}" + (f" {'vs base':>8}" if baseline else ""))
+    for r in results:
+        line = f"{r['target']:<12} {r['ns_per_log']:>9.0f} {r['logs_per_sec']:>11,}"
+        before = baseline.get(r["target"])
+        if before:
+            line += f" {(r['ns_per_log'] - before) / before:>+8.1%}"
+        print(line)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps({
+        "benchmark": "detection_pool",
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "count": args.count,
+        "batch_size": args.batch_size,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Log Parsing Benchmark
+=====================
+Compares ways of turning a stream entry into the object the detection
+pipeline works on, by construction time and by memory held per log (what
+the AI buffer pays for every log it keeps):
+
+  pydantic_validated   LogMessage(...)                  the pre-LogRecord path
+  pydantic_construct   LogMessage.model_construct(...)  unvalidated model
+  record               parse_stream_entry, fast path     LogRecord, no validation
+  record_strict        parse_stream_entry, LOG_STRICT_VALIDATION=True
+
+Usage (from threat-detection-service/):
+  python benchmarks/bench_log_parsing.py
+  python benchmarks/bench_log_parsing.py --count 100000 --compare benchmarks/results/log_parsing.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bench_rule_engine import MIXES, SERVICE_DIR, build_entries, git_commit, measure
+
+from app.core.config import settings
+from app.schema.detection import LogMessage
+from app.service.stream_consumer import parse_stream_entry
+
+
+def _fields(data: dict) -> dict:
+    return {
+        "id": data.get("id", ""),
+        "timestamp": data.get("timestamp", ""),
+        "source": data.get("source", ""),
+        "log_level": data.get("logLevel", "INFO"),
+        "message": data.get("message", ""),
+        "source_ip": data.get("sourceIp", ""),
+        "user_id": data.get("userId", ""),
+        "endpoint": data.get("endpoint", ""),
+        "method": data.get("method", ""),
+        "status_code": data.get("statusCode", ""),
+    }
+
+
+# target: (parse, LOG_STRICT_VALIDATION)
+TARGETS = {
+    "pydantic_validated": (lambda data: LogMessage(**_fields(data)), False),
+    "pydantic_construct": (lambda data: LogMessage.model_construct(**_fields(data)), False),
+    "record": (parse_stream_entry, False),
+    "record_strict": (parse_stream_entry, True),
+}
+
+
+def retained_bytes(parse, entries: list[dict]) -> float:
+    """Bytes allocated per log for the parsed objects that are kept (field strings are shared with the entry)."""
+    gc.collect()
+    tracemalloc.start()
+    kept = [parse(entry) for entry in entries]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Drop the list itself: one pointer per log
+    size = (current - len(kept) * 8) / len(kept)
+    del kept
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream entry parsing: time and memory per log")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=SERVICE_DIR / "benchmarks" / "results" / "log_parsing.json")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    entries = build_entries(MIXES["realistic"], args.count)
+
+    results = []
+    for target, (parse, strict) in TARGETS.items():
+        settings.LOG_STRICT_VALIDATION = strict
+        ns_per_log = measure(lambda: [parse(entry) for entry in entries], args.repeat, args.count)
+        results.append({
+            "target": target,
+            "ns_per_log": round(ns_per_log, 1),
+            "logs_per_sec": round(1e9 / ns_per_log),
+            "bytes_per_log": round(retained_bytes(parse, entries)),
+        })
+
+    settings.LOG_STRICT_VALIDATION = False
+
+    baseline = {}
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        baseline = {r["target"]: r["ns_per_log"] for r in previous["results"]}
+
+    print(f"{'target':<20} {'ns/log':>9} {'logs/sec':>11} {'bytes/log':>10}" + (f" {'vs base':>8}" if baseline else ""))
+    for r in results:
+        line = f"{r['target']:<20} {r['ns_per_log']:>9.0f} {r['logs_per_sec']:>11,} {r['bytes_per_log']:>10,}"
+        before = baseline.get(r["target"])
+        if before:
+            line += f" {(r['ns_per_log'] - before) / before:>+8.1%}"
+        print(line)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps({
+        "benchmark": "log_parsing",
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "count": args.count,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
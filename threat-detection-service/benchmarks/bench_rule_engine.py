@@ -0,0 +1,166 @@
+"""
+Rule Engine Benchmark
+=====================
+Measures the per-log hot path of the detection service: parse_stream_entry,
+every check_* rule and run_all_rules, on corpora built from the generators
+in tools/log_simulator.py at several traffic mixes.
+
+Corpora are stream entries in the field layout RedisStreamProducer publishes
+(all values strings), stamped with increasing event timestamps. Stateful
+rules start from empty state for every timed repetition.
+
+Results are printed and written as JSON. Pass --compare with an earlier
+results file to see the change per corpus/target between commits.
+
+Usage (from threat-detection-service/):
+  python benchmarks/bench_rule_engine.py
+  python benchmarks/bench_rule_engine.py --count 50000 --output before.json
+  python benchmarks/bench_rule_engine.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(SERVICE_DIR.parent / "tools"))
+
+from log_simulator import gen_normal, gen_brute_force, gen_sql_injection, gen_privilege_escalation  # noqa: E402
+
+from app.service import rule_engine  # noqa: E402
+from app.service.stream_consumer import parse_stream_entry  # noqa: E402
+
+# (generator, weight) per corpus
+MIXES = {
+    "normal": [(gen_normal, 1.0)],
+    "realistic": [(gen_normal, 0.95), (gen_brute_force, 0.02), (gen_sql_injection, 0.02), (gen_privilege_escalation, 0.01)],
+    "under_attack": [(gen_normal, 0.55), (gen_brute_force, 0.25), (gen_sql_injection, 0.1), (gen_privilege_escalation, 0.1)],
+}
+
+STATEFUL_CHECKS = [rule_engine.check_brute_force, rule_engine.check_path_scan, rule_engine.check_password_spray]
+STATELESS_CHECKS = [rule_engine.check_sql_injection, rule_engine.check_privilege_escalation]
+
+
+def build_entries(mix: list, count: int, rate_per_second: float = 200.0) -> list[dict]:
+    generators = [generator for generator, _ in mix]
+    weights = [weight for _, weight in mix]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    entries = []
+    for i in range(count):
+        entry = random.choices(generators, weights)[0]()
+        entry = {key: str(value) for key, value in entry.items()}
+        entry["id"] = str(i)
+        entry["timestamp"] = (start + timedelta(seconds=i / rate_per_second)).isoformat().replace("+00:00", "Z")
+        entries.append(entry)
+    return entries
+
+
+def measure(run, repeat: int, count: int, setup=None) -> float:
+    """Best-of-N nanoseconds per log."""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        run()
+        best = min(best, time.perf_counter_ns() - start)
+    return best / count
+
+
+def bench_corpus(entries: list[dict], repeat: int) -> dict[str, float]:
+    logs = [parse_stream_entry(entry) for entry in entries]
+    # Stateful checks get the same per-log times run_all_rules would pass in processing mode
+    now = time.time()
+    times = [now + i * 0.005 for i in range(len(logs))]
+    count = len(logs)
+
+    results = {
+        "parse_stream_entry": measure(lambda: [parse_stream_entry(e) for e in entries], repeat, count),
+    }
+    for check in STATEFUL_CHECKS:
+        results[check.__name__] = measure(
+            lambda check=check: [check(log, t) for log, t in zip(logs, times)],
+            repeat, count, setup=rule_engine.reset_rule_state,
+        )
+    for check in STATELESS_CHECKS:
+        results[check.__name__] = measure(lambda check=check: [check(log) for log in logs], repeat, count)
+    results["run_all_rules"] = measure(
+        lambda: [rule_engine.run_all_rules(log) for log in logs],
+        repeat, count, setup=rule_engine.reset_rule_state,
+    )
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule engine / parsing benchmark")
+    parser.add_argument("--count", type=int, default=20000, help="Logs per corpus")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions (best is reported)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus", choices=list(MIXES), action="append", help="Corpora to run (default: all)")
+    parser.add_argument("--output", type=Path, default=SERVICE_DIR / "benchmarks" / "results" / "rule_engine.json")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Detections log a warning per hit; keep the benchmark measuring the rules only
+    logging.disable(logging.CRITICAL)
+    random.seed(args.seed)
+
+    results = []
+    for name in args.corpus or list(MIXES):
+        entries = build_entries(MIXES[name], args.count)
+        for target, ns_per_log in bench_corpus(entries, args.repeat).items():
+            results.append({
+                "corpus": name,
+                "target": target,
+                "ns_per_log": round(ns_per_log, 1),
+                "logs_per_sec": round(1e9 / ns_per_log),
+            })
+
+    baseline = {}
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        baseline = {(r["corpus"], r["target"]): r["ns_per_log"] for r in previous["results"]}
+
+    print(f"{'corpus':<13} {'target':<27} {'ns/log':>9} {'logs/sec':>11}" + (f" {'vs base':>8}" if baseline else ""))
+    for r in results:
+        line = f"{r['corpus']:<13} {r['target']:<27} {r['ns_per_log']:>9.0f} {r['logs_per_sec']:>11,}"
+        before = baseline.get((r["corpus"], r["target"]))
+        if before:
+            line += f" {(r['ns_per_log'] - before) / before:>+8.1%}"
+        print(line)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps({
+        "benchmark": "rule_engine",
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "count": args.count,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
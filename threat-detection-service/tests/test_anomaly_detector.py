@@ -0,0 +1,37 @@
+from app.schema.detection import LogRecord
+from app.service.anomaly_detector import RateAnomalyDetector, RateBaseline
+
+
+def _log(source_ip: str) -> LogRecord:
+    return LogRecord(id="1", timestamp="", source="test", message="GET /", source_ip=source_ip)
+
+
+def test_eviction_skips_free_rows():
+    baseline = RateBaseline(16, alpha=0.1, z_threshold=4.0, min_count=20)
+    baseline.observe([f"a{i}" for i in range(10)], bucket=1, score=False)
+    baseline.observe([f"b{i}" for i in range(10)], bucket=2, score=False)
+    baseline.observe([f"c{i}" for i in range(10)], bucket=3, score=False)
+
+    assert baseline.stats()["tracked_keys"] <= 16
+    assert None not in baseline._index
+
+
+def test_new_ips_beyond_max_keys():
+    detector = RateAnomalyDetector(max_keys=1000)
+    for bucket in range(30):
+        detector.observe([_log(f"10.{bucket}.0.{i}") for i in range(90)], now=bucket * detector.bucket_seconds)
+
+    assert detector.stats()["source_ip"]["evictions"] > 0
+
+
+def test_new_key_is_not_scored_before_its_warmup():
+    detector = RateAnomalyDetector(warmup_buckets=0, key_warmup_buckets=3)
+    step = detector.bucket_seconds
+
+    # A new IP's first page load
+    assert detector.observe([_log("10.0.0.1")] * 20, now=0) == []
+
+    for bucket in range(1, 4):
+        detector.observe([_log("10.0.0.1")], now=bucket * step)
+    detections = detector.observe([_log("10.0.0.1")] * 50, now=4 * step)
+    assert [d["rule"] for d in detections] == ["rate_source_ip:10.0.0.1"]
@@ -0,0 +1,18 @@
+from app.service.suppression import INSERT, UPDATE, DetectionSuppressor
+
+
+def _row(source_ip: str = "10.0.0.1") -> dict:
+    return {"event_type": "BRUTE_FORCE", "source_ip": source_ip, "confidence": 1.0, "description": "failed logins"}
+
+
+def test_forgotten_event_is_opened_again():
+    suppressor = DetectionSuppressor()
+    kind, row = suppressor.apply(_row(), "brute_force", now=0)
+    assert kind == INSERT
+    assert suppressor.apply(_row(), "brute_force", now=1)[0] == UPDATE
+
+    # Its INSERT failed: the next repeat must insert a row again
+    suppressor.forget([row["dedup_key"]])
+    kind, reopened = suppressor.apply(_row(), "brute_force", now=2)
+    assert kind == INSERT
+    assert reopened["dedup_key"] != row["dedup_key"]